@@ -0,0 +1,257 @@
+"""GraphQL ASGI application."""
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+from inspect import isawaitable
+
+from ariadne.asgi import GraphQL as BaseGraphQL
+from ariadne.exceptions import HttpError, HttpBadRequestError
+from ariadne.extensions import ExtensionManager
+from ariadne.graphql import (
+    handle_graphql_errors, handle_query_result, parse_query, validate_query,
+    validate_query_body, validate_variables, validate_operation_name
+)
+from graphql import GraphQLError, ExecutionContext, execute, get_operation_ast, print_ast, validate
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+
+from aocrecs.cache import BoundedMemoryCache, CacheBus, CacheStatistics, digest
+from aocrecs.consts import MATCH_ADDED
+from aocrecs.cost import cost_rule
+from aocrecs.hints import max_age, IMMUTABLE
+
+
+LOGGER = logging.getLogger(__name__)
+DEFAULT_MAX_DOCUMENTS = 1000
+RESPONSE_NAMESPACE = 'aocrecs.api.responses'
+# Key prefix of responses that can change when a match is added.
+MUTABLE = 'mutable:'
+
+
+def query_hash(query):
+    """Hash a query the way APQ clients do."""
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class Documents:
+    """Parsed and validated documents keyed by query hash.
+
+    Registered documents are kept for the process lifetime. Others are
+    kept in a bounded LRU. Each document also carries the hash of its
+    printed form, which ignores formatting differences between clients.
+    """
+
+    def __init__(self, schema, max_entries=DEFAULT_MAX_DOCUMENTS):
+        """Initialize."""
+        self.schema = schema
+        self.max_entries = max_entries
+        self._registered = {}
+        self._recent = OrderedDict()
+
+    def register(self, query, sha256=None):
+        """Register a known document."""
+        sha256 = sha256 or query_hash(query)
+        self._registered[sha256] = self._compile(query)
+        return sha256
+
+    def get(self, query, sha256=None):
+        """Get document, validation errors and normalized hash by query text or hash."""
+        if query is None and sha256 is not None:
+            compiled = self._registered.get(sha256) or self._recent.get(sha256)
+            if not compiled:
+                raise GraphQLError('PersistedQueryNotFound')
+            return compiled
+        validate_query_body(query)
+        if sha256 is not None and sha256 != query_hash(query):
+            raise GraphQLError('provided sha does not match query')
+        sha256 = sha256 or query_hash(query)
+        if sha256 in self._registered:
+            return self._registered[sha256]
+        if sha256 in self._recent:
+            self._recent.move_to_end(sha256)
+            return self._recent[sha256]
+        compiled = self._compile(query)
+        self._recent[sha256] = compiled
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+        return compiled
+
+    def _compile(self, query):
+        """Parse and validate a query."""
+        document = parse_query(query)
+        return document, validate_query(self.schema, document), query_hash(print_ast(document))
+
+    def __len__(self):
+        """Number of documents."""
+        return len(self._registered) + len(self._recent)
+
+
+class GraphQL(BaseGraphQL):
+    """GraphQL application with persisted queries and query cost limits.
+
+    Clients may send `extensions.persistedQuery.sha256Hash` instead of the
+    query text once the document is known, either from the manifest loaded
+    at startup (a JSON object of hash to query) or from an earlier request.
+
+    Queries sent via GET are answered from a response cache for as long as
+    their cache hints allow, with `ETag` and `Cache-Control` headers. Adding
+    a match drops cached responses that are not immutable.
+    """
+
+    def __init__(self, schema, *, cost_budget=0, persisted_queries=None, **kwargs):
+        """Initialize."""
+        super(GraphQL, self).__init__(schema, **kwargs)
+        self.cost_budget = cost_budget
+        self.persisted_queries = persisted_queries
+        self.documents = Documents(schema)
+        self.responses = BoundedMemoryCache(namespace=RESPONSE_NAMESPACE)
+        CacheStatistics.register(RESPONSE_NAMESPACE, self.responses)
+        CacheBus.subscribe(MATCH_ADDED, self.invalidate)
+
+    async def invalidate(self, **_payload):
+        """Drop cached responses that are not immutable."""
+        await self.responses.clear(namespace=RESPONSE_NAMESPACE + MUTABLE)
+
+    async def setup(self):
+        """Register persisted queries."""
+        if not self.persisted_queries:
+            return
+        with open(self.persisted_queries) as handle:
+            manifest = json.load(handle)
+        for sha256, query in manifest.items():
+            self.documents.register(query, sha256)
+        LOGGER.info("registered %d persisted queries", len(manifest))
+
+    async def handle_http(self, scope, receive, send):
+        """Handle HTTP request, executing queries sent via GET."""
+        request = Request(scope=scope, receive=receive)
+        if request.method == 'GET' and ('query' in request.query_params or 'extensions' in request.query_params):
+            response = await self.graphql_get_server(request)
+            await response(scope, receive, send)
+        else:
+            await super(GraphQL, self).handle_http(scope, receive, send)
+
+    async def graphql_get_server(self, request):
+        """Handle GET request with response caching."""
+        try:
+            data = self.extract_data_from_query_params(request)
+        except HttpError as error:
+            return PlainTextResponse(error.message or error.status, status_code=400)
+
+        age, key = 0, None
+        persisted = (data.get('extensions') or {}).get('persistedQuery') or {}
+        try:
+            document, errors, normalized = self.documents.get(data.get('query'), persisted.get('sha256Hash'))
+        except GraphQLError:
+            document = None
+        operation = get_operation_ast(document, data.get('operationName')) if document else None
+        if operation and operation.operation.value != 'query':
+            return PlainTextResponse('Only queries can be sent via GET', status_code=405)
+        if operation and not errors:
+            age = max_age(self.schema, document, operation, data.get('variables'))
+            key = digest([normalized, data.get('variables'), data.get('operationName')])
+            if age < IMMUTABLE:
+                key = MUTABLE + key
+
+        cached = await self.responses.get(key) if age else None
+        if cached:
+            CacheStatistics.hit(RESPONSE_NAMESPACE)
+            return self.cached_response(request, *cached)
+
+        context_value = await self.get_context_for_request(request)
+        extensions = await self.get_extensions_for_request(request, context_value)
+        middleware = await self.get_middleware_for_request(request, context_value)
+        success, response = await self.execute_operation(data, context_value, extensions, middleware)
+        if not success:
+            return JSONResponse(response, status_code=400)
+        body = JSONResponse(response).body
+        if age:
+            age = max_age(self.schema, document, operation, data.get('variables'), response.get('data') or {})
+        if not age or 'errors' in response:
+            return Response(body, media_type='application/json', headers={'Cache-Control': 'no-cache'})
+        CacheStatistics.miss(RESPONSE_NAMESPACE)
+        cached = (body, '"{}"'.format(hashlib.sha1(body).hexdigest()), age)
+        await self.responses.set(key, cached, ttl=age)
+        return self.cached_response(request, *cached)
+
+    @staticmethod
+    def cached_response(request, body, etag, age):
+        """Respond with validators, or 304 when the client copy is current."""
+        headers = {'ETag': etag, 'Cache-Control': 'public, max-age={}'.format(age)}
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type='application/json', headers=headers)
+
+    @staticmethod
+    def extract_data_from_query_params(request):
+        """Get operation data from query string."""
+        data = {'query': request.query_params.get('query'), 'operationName': request.query_params.get('operationName')}
+        for name in ['variables', 'extensions']:
+            if name in request.query_params:
+                try:
+                    data[name] = json.loads(request.query_params[name])
+                except ValueError:
+                    raise HttpBadRequestError("Query parameter '{}' is not valid JSON".format(name))
+        return data
+
+    async def graphql_http_server(self, request):
+        """Handle HTTP request."""
+        try:
+            data = await self.extract_data_from_request(request)
+        except HttpError as error:
+            return PlainTextResponse(error.message or error.status, status_code=400)
+
+        context_value = await self.get_context_for_request(request)
+        extensions = await self.get_extensions_for_request(request, context_value)
+        middleware = await self.get_middleware_for_request(request, context_value)
+
+        success, response = await self.execute_operation(data, context_value, extensions, middleware)
+        status_code = 200 if success else 400
+        return JSONResponse(response, status_code=status_code)
+
+    async def execute_operation(self, data, context_value, extensions, middleware):
+        """Execute an operation using cached documents."""
+        extension_manager = ExtensionManager(extensions, context_value)
+        options = dict(
+            logger=self.logger,
+            error_formatter=self.error_formatter,
+            debug=self.debug,
+            extension_manager=extension_manager
+        )
+
+        with extension_manager.request():
+            try:
+                if not isinstance(data, dict):
+                    raise GraphQLError('Operation data should be a JSON object')
+                variables, operation_name = data.get('variables'), data.get('operationName')
+                validate_variables(variables)
+                validate_operation_name(operation_name)
+                persisted = (data.get('extensions') or {}).get('persistedQuery') or {}
+                document, errors, _ = self.documents.get(data.get('query'), persisted.get('sha256Hash'))
+                if not errors:
+                    errors = validate(self.schema, document, [cost_rule(context_value, variables, self.cost_budget)])
+                if errors:
+                    return handle_graphql_errors(errors, **options)
+
+                root_value = self.root_value
+                if callable(root_value):
+                    root_value = root_value(context_value, document)
+                    if isawaitable(root_value):
+                        root_value = await root_value
+
+                result = execute(
+                    self.schema,
+                    document,
+                    root_value=root_value,
+                    context_value=context_value,
+                    variable_values=variables,
+                    operation_name=operation_name,
+                    execution_context_class=ExecutionContext,
+                    middleware=extension_manager.as_middleware_manager(middleware)
+                )
+                if isawaitable(result):
+                    result = await result
+            except GraphQLError as error:
+                return handle_graphql_errors([error], **options)
+            return handle_query_result(result, **options)
@@ -0,0 +1,146 @@
+"""Compressed bitmaps."""
+from array import array
+from bisect import bisect_left
+
+
+ARRAY_MAX = 4096
+CONTAINER_BYTES = 8192
+
+
+def _cardinality(container):
+    """Number of values in a container."""
+    if isinstance(container, int):
+        return bin(container).count('1')
+    return len(container)
+
+
+def _to_bits(values):
+    """Convert an array container to a bitmap container."""
+    data = bytearray(CONTAINER_BYTES)
+    for value in values:
+        data[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _to_array(bits):
+    """Convert a bitmap container to an array container."""
+    data = bits.to_bytes(CONTAINER_BYTES, 'little')
+    return array('H', [
+        i << 3 | j for i, byte in enumerate(data) if byte for j in range(8) if byte >> j & 1
+    ])
+
+
+def _copy(container):
+    """Copy a container, since arrays are modified in place."""
+    return container if isinstance(container, int) else array('H', container)
+
+
+def _compact(container):
+    """Use the smaller representation of a container, or None if empty."""
+    if isinstance(container, int):
+        if not container:
+            return None
+        if _cardinality(container) <= ARRAY_MAX:
+            return _to_array(container)
+        return container
+    if not container:
+        return None
+    if len(container) > ARRAY_MAX:
+        return _to_bits(container)
+    return container
+
+
+def _and(left, right):
+    """Intersect two containers."""
+    if isinstance(left, int) and isinstance(right, int):
+        return _compact(left & right)
+    if isinstance(left, int):
+        left, right = right, left
+    if isinstance(right, int):
+        return _compact(array('H', [value for value in left if right >> value & 1]))
+    return _compact(array('H', sorted(set(left).intersection(right))))
+
+
+def _or(left, right):
+    """Unite two containers."""
+    if not isinstance(left, int) and not isinstance(right, int):
+        return _compact(array('H', sorted(set(left).union(right))))
+    if not isinstance(left, int):
+        left = _to_bits(left)
+    if not isinstance(right, int):
+        right = _to_bits(right)
+    return left | right
+
+
+class Bitmap:
+    """Set of non-negative integers, compressed roaring-style.
+
+    Values are split by their high 16 bits into containers of low 16 bits.
+    A container is a sorted array while it holds at most `ARRAY_MAX` values
+    and a 65536-bit integer once denser.
+    """
+
+    __slots__ = ('containers',)
+
+    def __init__(self, containers=None):
+        """Initialize."""
+        self.containers = containers or {}
+
+    def add(self, value):
+        """Add a value."""
+        high, low = value >> 16, value & 0xFFFF
+        container = self.containers.get(high)
+        if container is None:
+            self.containers[high] = array('H', [low])
+        elif isinstance(container, int):
+            self.containers[high] = container | 1 << low
+        else:
+            i = bisect_left(container, low)
+            if i == len(container) or container[i] != low:
+                container.insert(i, low)
+                if len(container) > ARRAY_MAX:
+                    self.containers[high] = _to_bits(container)
+
+    def __contains__(self, value):
+        """Check for a value."""
+        container = self.containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        i = bisect_left(container, low)
+        return i < len(container) and container[i] == low
+
+    def __len__(self):
+        """Number of values."""
+        return sum(_cardinality(container) for container in self.containers.values())
+
+    def __and__(self, other):
+        """Intersect."""
+        containers = {}
+        for high in self.containers.keys() & other.containers.keys():
+            container = _and(self.containers[high], other.containers[high])
+            if container is not None:
+                containers[high] = container
+        return Bitmap(containers)
+
+    def __or__(self, other):
+        """Unite."""
+        containers = {high: _copy(container) for high, container in self.containers.items()}
+        for high, container in other.containers.items():
+            containers[high] = _or(containers[high], container) if high in containers else _copy(container)
+        return Bitmap(containers)
+
+    def descending(self, below=None):
+        """Iterate values from largest to smallest, optionally only those below a value."""
+        for high in sorted(self.containers, reverse=True):
+            if below is not None and high > below >> 16:
+                continue
+            container = self.containers[high]
+            if isinstance(container, int):
+                container = _to_array(container)
+            for low in reversed(container):
+                value = high << 16 | low
+                if below is None or value < below:
+                    yield value
@@ -1,14 +1,36 @@
 """Caching."""
-from collections import defaultdict
+from collections import defaultdict, namedtuple, OrderedDict
+from collections.abc import Mapping
 
 import asyncio
+import fcntl
+import functools
+import hashlib
+import inspect
+import json
 import logging
+import os
+import pickle
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from aiocache import cached as aio_cached, multi_cached
+from aiocache.base import BaseCache
+from aiocache.serializers import NullSerializer
+from aocrecs.database import WORKLOAD, BACKGROUND
 
 
 LOGGER = logging.getLogger(__name__)
-CACHEABLE_TYPES = [int, str, dict, list, tuple, defaultdict]
+CACHEABLE_TYPES = [int, float, bool, str, dict, list, tuple, defaultdict, type(None)]
 DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_STALE_KEYS = 100
+WARMER_NAMESPACE = 'aocrecs.cache.Warmer'
+Stale = namedtuple('Stale', ['value', 'fresh_until'])
 
 
 def func_name(func):
@@ -16,51 +38,703 @@ def func_name(func):
     return '.'.join([func.__module__ or "", func.__name__])
 
 
+def canonical(value):
+    """Convert a value to a stable, JSON-encodable structure.
+
+    Mappings are sorted by key, recursively, so equal arguments always produce
+    equal keys regardless of insertion order or mapping type.
+    """
+    if isinstance(value, Mapping):
+        return sorted(
+            ([canonical(k), canonical(v)] for k, v in value.items()),
+            key=lambda pair: json.dumps(pair[0], sort_keys=True, default=str)
+        )
+    if isinstance(value, (set, frozenset)):
+        return sorted((canonical(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True, default=str))
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    return value
+
+
+def digest(value):
+    """Get a fixed-length digest of a value's canonical form."""
+    payload = json.dumps(canonical(value), separators=(',', ':'), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def source_version(func):
+    """Version persisted values of a function by a digest of its source.
+
+    Changing the statements or post-processing of the function then stops
+    serving values it computed before.
+    """
+    try:
+        return digest(inspect.getsource(inspect.unwrap(func)))
+    except (OSError, TypeError):
+        LOGGER.warning("no source for %s, persisting unversioned", func_name(func))
+        return True
+
+
 def key_builder(func, *args, **kwargs):
-    """Build cache key."""
-    return ''.join([
-        func_name(func),
-        str([arg for arg in args if type(arg) in CACHEABLE_TYPES]), # pylint: disable=unidiomatic-typecheck
-        str(sorted(kwargs.items()))
-    ])
+    """Build cache key.
+
+    Keys are the readable function name followed by a fixed-length digest of the arguments.
+    """
+    return '{}:{}'.format(func_name(func), digest([
+        [arg for arg in args if type(arg) in CACHEABLE_TYPES], # pylint: disable=unidiomatic-typecheck
+        kwargs
+    ]))
+
+
+def sizeof(value, seen=None):
+    """Approximate the memory footprint of a value in bytes."""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, bytearray)):
+        return size
+    if isinstance(value, Mapping):
+        size += sum(sizeof(k, seen) + sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(v, seen) for v in value)
+    return size
+
+
+class BoundedMemoryCache(BaseCache):
+    """In-process cache with an entry and byte budget and LRU eviction.
+
+    Each decorated function gets its own instance, so budgets apply per namespace.
+    Limits left unset fall back to the class-wide defaults, which `configure` sets.
+    """
+
+    NAME = 'bounded_memory'
+    max_entries_default = DEFAULT_MAX_ENTRIES
+    max_bytes_default = DEFAULT_MAX_BYTES
+
+    def __init__(self, serializer=None, max_entries=None, max_bytes=None, **kwargs):
+        """Initialize."""
+        super().__init__(serializer=serializer or NullSerializer(), **kwargs)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._store = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    @classmethod
+    def configure(cls, max_entries=None, max_bytes=None):
+        """Set default limits for instances without explicit limits."""
+        if max_entries is not None:
+            cls.max_entries_default = max_entries
+        if max_bytes is not None:
+            cls.max_bytes_default = max_bytes
+
+    @property
+    def max_entries(self):
+        """Maximum number of entries."""
+        return self._max_entries if self._max_entries is not None else self.max_entries_default
+
+    @property
+    def max_bytes(self):
+        """Maximum approximate size in bytes."""
+        return self._max_bytes if self._max_bytes is not None else self.max_bytes_default
+
+    def size(self):
+        """Report current and maximum size."""
+        return dict(
+            entries=len(self._store),
+            bytes=self._bytes,
+            max_entries=self.max_entries,
+            max_bytes=self.max_bytes,
+            evictions=self.evictions
+        )
+
+    def dump(self):
+        """Get (key, value, wall-clock expiry) for each entry."""
+        now, wall = time.monotonic(), time.time()
+        return [
+            (key, value, wall + expires - now if expires is not None else None)
+            for key, (value, _, expires) in self._store.items()
+        ]
+
+    def restore(self, entries, ttl=None):
+        """Load dumped entries; entries past expiry are kept for `ttl` more seconds."""
+        wall = time.time()
+        for key, value, expires in entries:
+            remaining = expires - wall if expires is not None else None
+            self._put(key, value, remaining if remaining is None or remaining > 0 else ttl)
+
+    def _lookup(self, key):
+        """Get a live entry, dropping it if expired."""
+        entry = self._store.get(key)
+        if entry is None:
+            return None
+        value, _, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            self._pop(key)
+            return None
+        self._store.move_to_end(key)
+        return value
+
+    def _pop(self, key):
+        """Remove an entry."""
+        entry = self._store.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[1]
+        return True
+
+    def _put(self, key, value, ttl):
+        """Add an entry and evict least recently used entries over budget."""
+        self._pop(key)
+        size = sizeof(value)
+        if size > self.max_bytes:
+            LOGGER.debug("not caching %s: %d bytes exceeds budget", key, size)
+            return False
+        self._store[key] = (value, size, time.monotonic() + ttl if ttl else None)
+        self._bytes += size
+        while len(self._store) > self.max_entries or self._bytes > self.max_bytes:
+            self._pop(next(iter(self._store)))
+            self.evictions += 1
+        return True
+
+    async def _get(self, key, encoding='utf-8', _conn=None):
+        return self._lookup(key)
+
+    async def _gets(self, key, encoding='utf-8', _conn=None):
+        return self._lookup(key)
+
+    async def _multi_get(self, keys, encoding='utf-8', _conn=None):
+        return [self._lookup(key) for key in keys]
+
+    async def _set(self, key, value, ttl=None, _cas_token=None, _conn=None):
+        if _cas_token is not None and _cas_token != self._lookup(key):
+            return 0
+        return self._put(key, value, ttl)
+
+    async def _multi_set(self, pairs, ttl=None, _conn=None):
+        for key, value in pairs:
+            self._put(key, value, ttl)
+        return True
+
+    async def _add(self, key, value, ttl=None, _conn=None):
+        if self._lookup(key) is not None:
+            raise ValueError("Key {} already exists, use .set to update the value".format(key))
+        return self._put(key, value, ttl)
+
+    async def _exists(self, key, _conn=None):
+        return self._lookup(key) is not None
+
+    async def _expire(self, key, ttl, _conn=None):
+        value = self._lookup(key)
+        if value is None:
+            return False
+        value, size, _ = self._store[key]
+        self._store[key] = (value, size, time.monotonic() + ttl if ttl else None)
+        return True
+
+    async def _delete(self, key, _conn=None):
+        return int(self._pop(key))
+
+    async def _clear(self, namespace=None, _conn=None):
+        if namespace:
+            for key in [k for k in self._store if k.startswith(namespace)]:
+                self._pop(key)
+        else:
+            self._store.clear()
+            self._bytes = 0
+        return True
 
 
 class cached(aio_cached): # pylint: disable=invalid-name
-    """Cache decorator with useful defaults."""
+    """Cache decorator with useful defaults.
+
+    Concurrent misses on the same key share a single in-flight computation.
+    With `stale_ttl`, expired values keep being served for up to `stale_ttl`
+    seconds while one background task refreshes them. With `persist`, values
+    are also kept in the persistent store, versioned by the source of the
+    function; pass a string to version them otherwise.
+
+    Events named in `invalidate_on` clear the namespace when published. Map
+    an event to a function of its payload and the arguments of an entry
+    instead to only drop the entries it returns true for.
+    """
 
-    def __init__(self, warm=False, **kwargs):
+    def __init__(self, warm=False, stale_ttl=None, persist=False, invalidate_on=None, **kwargs): # pylint: disable=too-many-arguments
         """Initialize."""
         if 'ttl' not in kwargs:
             kwargs['ttl'] = DEFAULT_TTL
+        kwargs.setdefault('cache', BoundedMemoryCache)
         self.warm = warm
+        self.namespace = None
         self.ttl = kwargs['ttl']
+        self.stale_ttl = stale_ttl if self.ttl else None
+        self.persist = persist
+        self.invalidate_on = invalidate_on if isinstance(invalidate_on, dict) else dict.fromkeys(invalidate_on or [])
+        self._generation = 0
+        self._inflight = {}
+        self._arguments = OrderedDict()
+        self._untracked = False
         aio_cached.__init__(self, key_builder=key_builder, **kwargs)
 
     def __call__(self, func):
         """Register with cache warmer if requested."""
         wrapped = aio_cached.__call__(self, func)
+        wrapped.cached = self
+        self.namespace = func_name(func)
+        if self.persist is True:
+            self.persist = source_version(func)
+        CacheStatistics.register(self.namespace, self.cache)
+        for event, affected in self.invalidate_on.items():
+            CacheBus.subscribe(event, functools.partial(self.invalidate, affected))
         if self.warm:
             CacheWarmer.register(wrapped, self.ttl, self.warm)
         return wrapped
 
+    async def invalidate(self, affected=None, **payload):
+        """Drop entries affected by an event, and results of computations already in flight.
+
+        Without `affected`, or if the arguments of some entries are unknown,
+        all entries are dropped.
+        """
+        self._generation += 1
+        self._inflight = {}
+        if affected is None or self._untracked:
+            self._arguments.clear()
+            self._untracked = False
+            await self.cache.clear(namespace='{}:'.format(self.namespace))
+            return
+        for key in [key for key, arguments in self._arguments.items() if affected(payload, arguments)]:
+            del self._arguments[key]
+            await self.cache.delete(key)
+
+    def track(self, key, func, args, kwargs):
+        """Remember the cacheable arguments of an entry, for targeted invalidation.
+
+        Entries are tracked up to the entry limit of the cache. Past it, the
+        next invalidation drops all entries.
+        """
+        if not any(self.invalidate_on.values()):
+            return
+        bound = inspect.signature(func).bind(*args, **kwargs).arguments
+        self._arguments.pop(key, None)
+        self._arguments[key] = {
+            name: value for name, value in bound.items() if type(value) in CACHEABLE_TYPES # pylint: disable=unidiomatic-typecheck
+        }
+        if len(self._arguments) > getattr(self.cache, 'max_entries', DEFAULT_MAX_ENTRIES):
+            self._arguments.popitem(last=False)
+            self._untracked = True
+
+    def restore(self, entries):
+        """Load dumped entries, whose arguments are unknown."""
+        self.cache.restore(entries, ttl=self.ttl)
+        if entries:
+            self._untracked = True
+
+    async def decorator(self, f, *args, cache_read=True, cache_write=True, aiocache_wait_for_write=True, **kwargs):
+        """Serve from cache or join the in-flight computation for the key."""
+        key = self.get_cache_key(f, args, kwargs)
+        if cache_read:
+            value = await self.get_from_cache(key)
+            if isinstance(value, Stale):
+                if value.fresh_until > time.time():
+                    CacheStatistics.hit(self.namespace)
+                    return value.value
+                CacheStatistics.stale(self.namespace, key)
+                if key not in self._inflight:
+                    self._start(f, key, args, kwargs, cache_write).add_done_callback(
+                        functools.partial(self._refreshed, key)
+                    )
+                return value.value
+            if value is not None:
+                CacheStatistics.hit(self.namespace)
+                return value
+        CacheStatistics.miss(self.namespace)
+        task = self._inflight.get(key) or self._start(f, key, args, kwargs, cache_write)
+        return await asyncio.shield(task)
+
+    def _start(self, f, key, args, kwargs, cache_write):
+        """Start computing a key."""
+        task = asyncio.ensure_future(self._compute(f, key, args, kwargs, cache_write))
+        self._inflight[key] = task
+        task.add_done_callback(functools.partial(self._finished, key))
+        return task
+
+    async def _compute(self, f, key, args, kwargs, cache_write):
+        """Compute a value and cache it if successful."""
+        self.track(key, f, args, kwargs)
+        if self.persist:
+            result = await CacheStore.get(self.namespace, self.persist, key)
+            if result is not None:
+                await self.set_in_cache(key, result)
+                return result
+        generation = self._generation
+        start = time.monotonic()
+        result = await f(*args, **kwargs)
+        CacheStatistics.computed(self.namespace, time.monotonic() - start)
+        if cache_write and generation == self._generation:
+            await self.set_in_cache(key, result)
+            if self.persist:
+                await CacheStore.set(self.namespace, self.persist, key, result)
+        return result
+
+    async def set_in_cache(self, key, value):
+        """Set value, keeping it past expiry when serving stale values."""
+        ttl = self.ttl
+        if self.stale_ttl:
+            value = Stale(value, time.time() + self.ttl)
+            ttl = self.ttl + self.stale_ttl
+        try:
+            await self.cache.set(key, value, ttl=ttl)
+        except Exception: # pylint: disable=broad-except
+            LOGGER.exception("couldn't set %s, unexpected error", key)
+
+    def _finished(self, key, task):
+        """Release the in-flight slot so failures are retried by the next caller."""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    @staticmethod
+    def _refreshed(key, task):
+        """Log failed background refreshes."""
+        if not task.cancelled() and task.exception():
+            LOGGER.warning("failed to refresh %s: %s", key, task.exception())
+
 
 class dataloader_cached(multi_cached): # pylint: disable=invalid-name
-    """Multi-cache decorator with useful defaults."""
+    """Multi-cache decorator with useful defaults.
+
+    With `persist`, keys missing from memory are looked up in the persistent
+    store before computing. They are versioned by the source of the function;
+    pass a string to version them otherwise.
+    """
 
-    def __init__(self, **kwargs):
+    def __init__(self, persist=False, **kwargs):
         """Initialize."""
         if 'ttl' not in kwargs:
             kwargs['ttl'] = DEFAULT_TTL
+        kwargs.setdefault('cache', BoundedMemoryCache)
+        self.namespace = None
+        self.persist = persist
         multi_cached.__init__(self, keys_from_attr='keys', **kwargs)
 
     def __call__(self, func):
         """Set namespace based on function name before calling."""
-        self._kwargs['namespace'] = func_name(func)
-        return multi_cached.__call__(self, func)
+        self.namespace = func_name(func)
+        self._kwargs['namespace'] = self.namespace
+        if self.persist is True:
+            self.persist = source_version(func)
+        wrapped = multi_cached.__call__(self, func)
+        CacheStatistics.register(self.namespace, self.cache)
+        return wrapped
+
+    def get_cache_keys(self, f, args, kwargs):
+        """Find keys by argument name in the undecorated function.
+
+        Wrappers such as `workload` take `*args`, which hides the names.
+        """
+        return multi_cached.get_cache_keys(self, inspect.unwrap(f), args, kwargs)
+
+    async def decorator(self, f, *args, cache_read=True, cache_write=True, aiocache_wait_for_write=True, **kwargs):
+        """Load cached keys and compute the rest, recording statistics."""
+        missing_keys = []
+        partial = {}
+        keys, new_args, args_index = self.get_cache_keys(f, args, kwargs)
+
+        if cache_read:
+            for key, value in zip(keys, await self.get_from_cache(*keys)):
+                if value is None:
+                    missing_keys.append(key)
+                else:
+                    partial[key] = value
+            CacheStatistics.hit(self.namespace, len(partial))
+            if not missing_keys:
+                return partial
+        else:
+            missing_keys = list(keys)
+
+        if self.persist and missing_keys:
+            stored = {}
+            for key, value in zip(missing_keys, await CacheStore.multi_get(self.namespace, self.persist, missing_keys)):
+                if value is not None:
+                    stored[key] = value
+            if stored:
+                await self.set_in_cache(stored, f, args, kwargs)
+                partial.update(stored)
+                missing_keys = [key for key in missing_keys if key not in stored]
+                if not missing_keys:
+                    return partial
+        CacheStatistics.miss(self.namespace, len(missing_keys))
+
+        if args_index > -1:
+            new_args[args_index] = missing_keys
+        else:
+            kwargs[self.keys_from_attr] = missing_keys
+
+        start = time.monotonic()
+        result = await f(*new_args, **kwargs)
+        CacheStatistics.computed(self.namespace, time.monotonic() - start)
+        result.update(partial)
+
+        if cache_write:
+            if aiocache_wait_for_write:
+                await self.set_in_cache(result, f, args, kwargs)
+            else:
+                asyncio.ensure_future(self.set_in_cache(result, f, args, kwargs))
+            if self.persist:
+                await CacheStore.multi_set(
+                    self.namespace, self.persist, [(key, result[key]) for key in missing_keys if key in result]
+                )
+        return result
+
+
+class Statistics:
+    """Hit, miss and compute time counters per cache namespace.
+
+    Stale values served are also counted per key, for the `max_stale_keys`
+    keys of each namespace most recently served stale.
+    """
+
+    FIELDS = ['hits', 'stale_hits', 'misses', 'computations', 'compute_seconds']
+
+    def __init__(self, max_stale_keys=DEFAULT_STALE_KEYS):
+        """Initialize registry."""
+        self.max_stale_keys = max_stale_keys
+        self._caches = {}
+        self._counters = {}
+        self._stale_keys = {}
+
+    def register(self, namespace, cache):
+        """Register a namespace and its cache backend."""
+        self._caches[namespace] = cache
+        self._counters[namespace] = dict.fromkeys(self.FIELDS, 0)
+        self._stale_keys[namespace] = OrderedDict()
+
+    def hit(self, namespace, count=1):
+        """Record cache hits."""
+        self._counters[namespace]['hits'] += count
+
+    def stale(self, namespace, key):
+        """Record a stale value being served."""
+        self._counters[namespace]['stale_hits'] += 1
+        keys = self._stale_keys[namespace]
+        keys[key] = keys.pop(key, 0) + 1
+        if len(keys) > self.max_stale_keys:
+            keys.popitem(last=False)
+
+    def miss(self, namespace, count=1):
+        """Record cache misses."""
+        self._counters[namespace]['misses'] += count
+
+    def computed(self, namespace, seconds):
+        """Record time spent computing missed values."""
+        self._counters[namespace]['computations'] += 1
+        self._counters[namespace]['compute_seconds'] += seconds
+
+    def collect(self):
+        """Get statistics for all namespaces."""
+        output = {}
+        for namespace, counters in self._counters.items():
+            cache = self._caches[namespace]
+            size = cache.size() if hasattr(cache, 'size') else {}
+            lookups = counters['hits'] + counters['stale_hits'] + counters['misses']
+            output[namespace] = dict(
+                counters,
+                hit_ratio=(counters['hits'] + counters['stale_hits']) / lookups if lookups else None,
+                avg_compute_seconds=(
+                    counters['compute_seconds'] / counters['computations'] if counters['computations'] else None
+                ),
+                entries=size.get('entries'),
+                bytes=size.get('bytes'),
+                evictions=size.get('evictions'),
+                stale_keys=dict(self._stale_keys[namespace])
+            )
+        return output
+
+    def stale_keys(self):
+        """Get the number of stale values served per key, for all namespaces."""
+        return {key: count for keys in self._stale_keys.values() for key, count in keys.items()}
+
+
+class Store:
+    """Persistent SQLite tier for values that never change once computed.
+
+    Operations run on a single background thread. The store is optional: until
+    it is given a path, reads miss and writes are dropped.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        self._path = None
+        self._connection = None
+        self._executor = None
+
+    def __call__(self, path):
+        """Set database file path."""
+        self._path = path
+        return self
+
+    @property
+    def enabled(self):
+        """Whether the store is open."""
+        return self._connection is not None
+
+    def lock_path(self, name):
+        """Get a lock file path next to the store, shared by all workers on the host."""
+        return '{}.{}.lock'.format(self._path, hashlib.sha1(name.encode()).hexdigest())
+
+    def _open(self):
+        connection = sqlite3.connect(self._path, check_same_thread=False)
+        connection.execute('pragma journal_mode=wal')
+        connection.execute("""
+            create table if not exists cache (
+                namespace text not null,
+                key text not null,
+                value blob not null,
+                primary key (namespace, key)
+            )
+        """)
+        connection.commit()
+        return connection
+
+    def _multi_get(self, namespace, keys):
+        values = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            query = 'select key, value from cache where namespace=? and key in ({})'.format(','.join('?' * len(chunk)))
+            values.update(self._connection.execute(query, [namespace] + chunk).fetchall())
+        return [pickle.loads(values[key]) if key in values else None for key in keys]
+
+    def _multi_set(self, namespace, pairs):
+        self._connection.executemany(
+            'insert or replace into cache (namespace, key, value) values (?, ?, ?)',
+            [(namespace, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in pairs]
+        )
+        self._connection.commit()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _namespace(namespace, version):
+        return namespace if version is True else '{}@{}'.format(namespace, version)
+
+    async def multi_get(self, namespace, version, keys):
+        """Get stored values, or None for each missing key."""
+        if not self.enabled:
+            return [None] * len(keys)
+        try:
+            return await self._run(self._multi_get, self._namespace(namespace, version), [str(k) for k in keys])
+        except Exception: # pylint: disable=broad-except
+            LOGGER.exception("couldn't read %s from store", namespace)
+            return [None] * len(keys)
+
+    async def multi_set(self, namespace, version, pairs):
+        """Store values."""
+        if not self.enabled or not pairs:
+            return
+        try:
+            await self._run(self._multi_set, self._namespace(namespace, version), [(str(k), v) for k, v in pairs])
+        except Exception: # pylint: disable=broad-except
+            LOGGER.exception("couldn't write %s to store", namespace)
+
+    async def get(self, namespace, version, key):
+        """Get a stored value."""
+        return (await self.multi_get(namespace, version, [key]))[0]
+
+    async def set(self, namespace, version, key, value):
+        """Store a value."""
+        await self.multi_set(namespace, version, [(key, value)])
+
+    async def setup(self):
+        """Open the store if a path is configured."""
+        if not self._path:
+            LOGGER.info("persistent cache store is disabled")
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connection = await self._run(self._open)
+        LOGGER.info("opened persistent cache store at %s", self._path)
+
+    async def teardown(self):
+        """Close the store."""
+        if not self.enabled:
+            return
+        await self._run(self._connection.close)
+        self._connection = None
+        self._executor.shutdown()
+
+
+class Bus:
+    """Deliver published events to the caches that depend on them."""
+
+    def __init__(self):
+        """Initialize registry."""
+        self._subscribers = defaultdict(list)
+
+    def subscribe(self, event, callback):
+        """Call a coroutine function with the event payload on publish."""
+        self._subscribers[event].append(callback)
+
+    async def publish(self, event, **payload):
+        """Publish an event."""
+        LOGGER.info("publishing %s to %d subscribers", event, len(self._subscribers[event]))
+        results = await asyncio.gather(
+            *[callback(**payload) for callback in self._subscribers[event]],
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                LOGGER.error("failed to handle %s: %s", event, result)
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, held across worker processes."""
+
+    def __init__(self, path, poll=0.5):
+        """Initialize."""
+        self.path = path
+        self.poll = poll
+        self._file = None
+
+    async def __aenter__(self):
+        """Wait for the lock without blocking the event loop."""
+        self._file = open(self.path, 'a')
+        while True:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except BlockingIOError:
+                await asyncio.sleep(self.poll)
+            except BaseException:
+                self._file.close()
+                raise
+
+    async def __aexit__(self, *args):
+        """Release the lock."""
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
 
 
 class Warmer:
-    """Schedule period cache warming based on TTL."""
+    """Schedule period cache warming based on TTL.
+
+    Each registered function and argument list is a job. Jobs start after a
+    random delay, share a concurrency limit, time out, and back off
+    exponentially after failures.
+
+    When the persistent store is enabled, workers on the same host coordinate:
+    the first worker to lock a job runs it and shares the result through the
+    store, and the others load that result instead of running the job. Local
+    jobs registered as exclusive are likewise run by one worker at a time, and
+    skipped by the others if run recently.
+
+    With a snapshot path, warmed entries are saved on teardown and restored on
+    setup, so they are served (possibly stale) until their jobs refresh them.
+    """
 
     def __init__(self):
         """Initialize registry."""
@@ -68,37 +742,162 @@ class Warmer:
         self._database = None
         self._registry = {}
         self._tasks = []
+        self._status = {}
+        self._semaphore = None
+        self._snapshot = None
+        self._pending = set()
+        self._started = None
+        self.concurrency = 4
+        self.jitter = 30
+        self.timeout = 900
+        self.backoff = 30
+        self.max_backoff = 3600
 
-    def __call__(self, database, disable=False):
-        """Set database."""
+    def __call__(self, database, disable=False, concurrency=None, jitter=None, timeout=None, snapshot=None): # pylint: disable=too-many-arguments
+        """Set database and scheduling options."""
         self._database = database
         self._disable = disable
+        self._snapshot = snapshot
+        if concurrency is not None:
+            self.concurrency = concurrency
+        if jitter is not None:
+            self.jitter = jitter
+        if timeout is not None:
+            self.timeout = timeout
         return self
 
-    def register(self, func, interval, args):
-        """Register a function with interval."""
+    def register(self, func, interval, args, local=False, exclusive=False):
+        """Register a function with interval.
+
+        Local jobs maintain per-process state, such as in-memory indexes,
+        so every worker runs them and their results are not cached. Local
+        jobs with shared effects, such as writing to the database, are
+        exclusive, so that only one worker needs to run them.
+        """
         if interval:
             LOGGER.info("registering %s to warm every %d minutes", func_name(func), interval/60)
         else:
             LOGGER.info("registering %s to warm once", func_name(func))
-        self._registry[func] = dict(interval=interval, args=args)
+        self._registry[func] = dict(interval=interval, args=args, local=local, exclusive=exclusive)
+
+    def jobs(self):
+        """Get (name, function, arguments, interval) for each job."""
+        for func, data in self._registry.items():
+            args = data['args'] if isinstance(data['args'], list) else [[]]
+            for arg in args:
+                arg = arg if isinstance(arg, list) else [arg]
+                yield '{}{}'.format(func_name(func), arg), func, arg, data['interval']
+
+    async def schedule(self, name, func, args, interval):
+        """Run a job every interval, backing off on failure.
 
-    async def schedule(self, func, data):
-        """Schedule a function with interval."""
+        Jobs use the background database pool.
+        """
+        WORKLOAD.set(BACKGROUND)
+        status = self._status[name]
+        failures = 0
+        await asyncio.sleep(random.uniform(0, self.jitter))
         while True:
-            if not isinstance(data['args'], list):
-                data['args'] = [[]]
-            for arg in data['args']:
-                if data['interval'] and data['interval'] > 60:
-                    LOGGER.info("warming cache for %s", key_builder(func, *arg))
-                await func(self._database, *arg)
-                if data['interval'] and data['interval'] > 60:
-                    LOGGER.info("... done warming cache for %s", key_builder(func, *arg))
-            if data['interval']:
-                await asyncio.sleep(data['interval'])
+            async with self._semaphore:
+                if interval and interval > 60:
+                    LOGGER.info("warming cache for %s", name)
+                start = time.monotonic()
+                try:
+                    await asyncio.wait_for(self.run(name, func, args, interval), self.timeout)
+                except Exception as error: # pylint: disable=broad-except
+                    failures += 1
+                    status.update(failures=status['failures'] + 1, last_error=repr(error))
+                    delay = min(self.backoff * 2 ** (failures - 1), self.max_backoff)
+                    LOGGER.warning("failed to warm %s (attempt %d), retrying in %ds: %r", name, failures, delay, error)
+                else:
+                    failures = 0
+                    duration = time.monotonic() - start
+                    status.update(runs=status['runs'] + 1, last_duration=duration, last_success=time.time())
+                    if interval and interval > 60:
+                        LOGGER.info("... done warming cache for %s in %.2fs", name, duration)
+                    if name in self._pending:
+                        self._pending.remove(name)
+                        if not self._pending:
+                            LOGGER.info("cache warm-up finished in %.2fs", time.monotonic() - self._started)
+            if failures:
+                await asyncio.sleep(delay)
+            elif interval:
+                await asyncio.sleep(interval)
             else:
                 break
 
+    async def run(self, name, func, args, interval):
+        """Run a job, or load its result if another worker ran it recently."""
+        local = self._registry[func]['local']
+        if local and not (self._registry[func]['exclusive'] and CacheStore.enabled):
+            await func(self._database, *args)
+            return
+        if not CacheStore.enabled:
+            await func(self._database, *args, cache_read=False)
+            return
+        async with FileLock(CacheStore.lock_path(name)):
+            shared = await CacheStore.get(WARMER_NAMESPACE, True, name)
+            if shared and time.time() - shared[0] < (interval or self.jitter + self.timeout):
+                if not local:
+                    LOGGER.debug("loading %s warmed by another worker", name)
+                    key = key_builder(func, self._database, *args)
+                    func.cached.track(key, func, [self._database] + args, {})
+                    await func.cached.set_in_cache(key, shared[1])
+                self._status[name]['shared'] += 1
+                return
+            started = time.time()
+            if local:
+                value = await func(self._database, *args)
+            else:
+                value = await func(self._database, *args, cache_read=False)
+            await CacheStore.set(WARMER_NAMESPACE, True, name, (started, None if local else value))
+
+    def status(self):
+        """Get run statistics for each job."""
+        return {name: dict(status) for name, status in self._status.items()}
+
+    def _warmed(self):
+        """Get cache decorators of registered functions."""
+        return [
+            func.cached for func, data in self._registry.items() if not data['local'] and hasattr(func.cache, 'dump')
+        ]
+
+    def save_snapshot(self):
+        """Write warmed cache entries to the snapshot file.
+
+        Each writer uses its own temporary file, so concurrent shutdowns
+        replace the snapshot with one complete file.
+        """
+        start = time.monotonic()
+        data = {cached_.namespace: cached_.cache.dump() for cached_ in self._warmed()}
+        handle, path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self._snapshot)), suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as snapshot:
+                pickle.dump(dict(created=time.time(), namespaces=data), snapshot, pickle.HIGHEST_PROTOCOL)
+            os.replace(path, self._snapshot)
+        except BaseException:
+            os.unlink(path)
+            raise
+        LOGGER.info(
+            "saved %d cache entries to snapshot in %.2fs",
+            sum(len(entries) for entries in data.values()), time.monotonic() - start
+        )
+
+    def load_snapshot(self):
+        """Restore warmed cache entries from the snapshot file."""
+        start = time.monotonic()
+        with open(self._snapshot, 'rb') as snapshot:
+            data = pickle.load(snapshot)
+        count = 0
+        for cached_ in self._warmed():
+            entries = data['namespaces'].get(cached_.namespace, [])
+            cached_.restore(entries)
+            count += len(entries)
+        LOGGER.info(
+            "restored %d cache entries from %ds old snapshot in %.2fs",
+            count, time.time() - data['created'], time.monotonic() - start
+        )
+
     async def setup(self):
         """Connect database and schedule registry."""
         if not self._database:
@@ -107,15 +906,34 @@ class Warmer:
         if self._disable:
             LOGGER.info("cache warming is disabled")
             return
-        for func, data in self._registry.items():
-            self._tasks.append(asyncio.get_event_loop().create_task(self.schedule(func, data)))
+        if self._snapshot and os.path.exists(self._snapshot):
+            try:
+                self.load_snapshot()
+            except Exception: # pylint: disable=broad-except
+                LOGGER.exception("couldn't restore cache snapshot")
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._started = time.monotonic()
+        for name, func, args, interval in self.jobs():
+            self._pending.add(name)
+            self._status[name] = dict(
+                interval=interval, runs=0, shared=0, failures=0, last_duration=None, last_success=None, last_error=None
+            )
+            self._tasks.append(asyncio.get_event_loop().create_task(self.schedule(name, func, args, interval)))
 
     async def teardown(self):
         """Cancel scheduled tasks and stop and disconnect database."""
         for task in self._tasks:
             task.cancel()
         LOGGER.info("canceled warming tasks")
+        if self._snapshot and not self._disable:
+            try:
+                self.save_snapshot()
+            except Exception: # pylint: disable=broad-except
+                LOGGER.exception("couldn't save cache snapshot")
         await self._database.disconnect()
 
 
 CacheWarmer = Warmer() # pylint: disable=invalid-name
+CacheStatistics = Statistics() # pylint: disable=invalid-name
+CacheStore = Store() # pylint: disable=invalid-name
+CacheBus = Bus() # pylint: disable=invalid-name
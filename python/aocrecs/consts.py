@@ -4,6 +4,7 @@ import datetime
 S3_BUCKET = 'aoc-recs'
 S3_BUCKET_ERRORS = 'aoc-error-recs'
 COLLECTION_STARTED = datetime.date(2019, 5, 1)
+MATCH_ADDED = 'match_added'
 NORMALIZED_VILLAGER_ID = 83
 VILLAGER_IDS = [
     83, 218, 123, 581, 579, 354, 120, 220, 259, 212, 112,
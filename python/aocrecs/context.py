@@ -1,8 +1,67 @@
 """GraphQL Context."""
+import asyncio
 
 from aiodataloader import DataLoader
 
 
+class SharedBatch:
+    """Merge keys requested by concurrent requests into one batch function call.
+
+    Keys collected during `window` seconds are loaded together. Batch functions
+    only use `context.database`, which all requests share, so the batch runs
+    with the context of the request that opened the window.
+    """
+
+    def __init__(self, func, window):
+        """Initialize."""
+        self.func = func
+        self.window = window
+        self._pending = {}
+        self._context = None
+
+    async def load_many(self, keys, context):
+        """Load keys in the next shared batch."""
+        loop = asyncio.get_event_loop()
+        futures = []
+        for key in keys:
+            if key not in self._pending:
+                self._pending[key] = loop.create_future()
+            futures.append(self._pending[key])
+        if self._context is None:
+            self._context = context
+            loop.call_later(self.window, self._dispatch)
+        return await asyncio.gather(*futures)
+
+    def _dispatch(self):
+        """Close the window and run the batch."""
+        pending, context = self._pending, self._context
+        self._pending, self._context = {}, None
+        asyncio.ensure_future(self._run(pending, context))
+
+    async def _run(self, pending, context):
+        """Call batch function and fan out results."""
+        try:
+            results = await self.func(list(pending), context)
+        except Exception as error: # pylint: disable=broad-except
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+SHARED_BATCHES = {}
+
+
+def shared_batch(func, window):
+    """Get the process-wide batch for a function."""
+    if func not in SHARED_BATCHES:
+        SHARED_BATCHES[func] = SharedBatch(func, window)
+    return SHARED_BATCHES[func]
+
+
 class ContextLoader(DataLoader):
     """Dataloader that provides GraphQL context."""
 
@@ -14,17 +73,24 @@ class ContextLoader(DataLoader):
 
     async def batch_load_fn(self, keys): # pylint: disable=method-hidden
         """Call batch function and sort output."""
+        if self.context.batch_window:
+            return await shared_batch(self.func, self.context.batch_window).load_many(keys, self.context)
         results = await self.func(keys, self.context)
         return [results.get(ref) for ref in keys]
 
 
 class Context:
-    """Context."""
+    """Context.
+
+    With a `batch_window` in seconds, loader batches are shared across requests.
+    """
 
-    def __init__(self, request, database):
+    def __init__(self, request, database, batch_window=0):
         """Initialize context."""
         self.request = request
         self.database = database
+        self.batch_window = batch_window
+        self.cost = None
         self._funcs = {}
 
     def register(self, func):
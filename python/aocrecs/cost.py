@@ -0,0 +1,162 @@
+"""GraphQL query cost analysis.
+
+Each field costs its weight plus the cost of its selections, multiplied by
+the expected number of list items. A `limit` argument sets the size of the
+list it applies to: the field itself if it is a list, otherwise the lists
+directly below it, such as the hits of a search. Sizes are capped where the
+resolver caps them. Fields computed once per item of a list argument are
+charged per item. Queries over budget are rejected during validation.
+"""
+from ariadne.types import Extension
+from graphql import GraphQLError, get_named_type, is_list_type, value_from_ast
+from graphql.type.definition import get_nullable_type
+from graphql.validation import ValidationRule
+
+from aocrecs.logic.search import SEARCH_LIMIT
+
+
+# Weights of fields that cost more than a dictionary lookup.
+FIELD_COSTS = {
+    'Match.odds': 25,
+    'Match.graph': 25,
+    'Match.chat': 2,
+    'Match.market': 5,
+    'Match.tribute': 2,
+    'Match.map_events': 5,
+    'Player.flags': 20,
+    'Player.map_control': 20,
+    'Player.metrics': 10,
+    'Player.timeseries': 10,
+    'Player.villager_allocation': 10,
+    'Player.apm': 5,
+    'Player.units_trained': 5,
+    'Player.research': 5,
+    'Player.trade_carts': 5,
+    'Player.villagers': 5,
+    'Player.transactions': 5,
+    'Hits.count': 5,
+    'Hits.capped_count': 2,
+    'Hits.facets': 10
+}
+# Expected size of lists without a `limit` argument.
+LIST_SIZES = {
+    'Match.players': 8,
+    'Match.teams': 2,
+    'Team.players': 4
+}
+# Most items a resolver returns, whatever the requested `limit`.
+LIMIT_CAPS = {
+    'Hits.hits': SEARCH_LIMIT
+}
+# Fields computed once per item of a list argument.
+PER_ITEM_ARGUMENTS = {
+    'Hits.facets': 'fields'
+}
+DEFAULT_COMPOSITE_COST = 1
+DEFAULT_BUDGET = 2000
+
+
+def argument_items(node, field, name, variables):
+    """Number of items in a list argument, at least 1."""
+    for argument in node.arguments:
+        if argument.name.value == name:
+            value = value_from_ast(argument.value, field.args[name].type, variables)
+            if isinstance(value, list):
+                return max(len(value), 1)
+    return 1
+
+
+def argument_limit(node, field, variables):
+    """Value of the `limit` argument, its default if not given, or None without one."""
+    if 'limit' not in field.args:
+        return None
+    limit = field.args['limit'].default_value
+    for argument in node.arguments:
+        if argument.name.value == 'limit':
+            limit = value_from_ast(argument.value, field.args['limit'].type, variables)
+    return limit if isinstance(limit, int) else field.args['limit'].default_value
+
+
+def field_cost(rule, node, parent_type, variables, limit=None): # pylint: disable=too-many-arguments
+    """Cost of a field node.
+
+    `limit` is the `limit` argument of the parent field, which sizes lists
+    directly below a field that is not itself a list.
+    """
+    name = node.name.value
+    if name.startswith('__') or name not in parent_type.fields:
+        return 0
+    field = parent_type.fields[name]
+    key = '{}.{}'.format(parent_type.name, name)
+    child_type = get_named_type(field.type)
+    items = 1
+    if key in PER_ITEM_ARGUMENTS:
+        items = argument_items(node, field, PER_ITEM_ARGUMENTS[key], variables)
+    if not node.selection_set:
+        return items * FIELD_COSTS.get(key, 0)
+    own_limit = argument_limit(node, field, variables)
+    multiplier = 1
+    child_limit = None
+    if key in PER_ITEM_ARGUMENTS:
+        multiplier = items
+    elif is_list_type(get_nullable_type(field.type)):
+        multiplier = own_limit or LIST_SIZES.get(key) or limit or 1
+    else:
+        child_limit = own_limit
+    if key in LIMIT_CAPS:
+        multiplier = min(multiplier, LIMIT_CAPS[key])
+    children = selection_cost(rule, node.selection_set, child_type, variables, child_limit)
+    return items * FIELD_COSTS.get(key, DEFAULT_COMPOSITE_COST) + max(multiplier, 0) * children
+
+
+def selection_cost(rule, selection_set, parent_type, variables, limit=None):
+    """Cost of a selection set."""
+    cost = 0
+    for selection in selection_set.selections:
+        if selection.kind == 'field':
+            cost += field_cost(rule, selection, parent_type, variables, limit)
+            continue
+        if selection.kind == 'fragment_spread':
+            fragment = rule.context.get_fragment(selection.name.value)
+            if not fragment:
+                continue
+            type_condition, selections = fragment.type_condition, fragment.selection_set
+        else:
+            type_condition, selections = selection.type_condition, selection.selection_set
+        fragment_type = rule.context.schema.get_type(type_condition.name.value) if type_condition else parent_type
+        if hasattr(fragment_type, 'fields'):
+            cost += selection_cost(rule, selections, fragment_type, variables, limit)
+    return cost
+
+
+def cost_rule(context, variables, budget):
+    """Create a validation rule enforcing the budget.
+
+    The computed cost is stored on the context for reporting.
+    """
+    class QueryCost(ValidationRule):
+        """Reject operations over budget."""
+
+        def enter_operation_definition(self, node, *_args):
+            """Compute operation cost."""
+            root = getattr(self.context.schema, '{}_type'.format(node.operation.value))
+            if not root:
+                return
+            cost = selection_cost(self, node.selection_set, root, variables or {})
+            context.cost = dict(requested=max(cost, (context.cost or {}).get('requested', 0)), budget=budget)
+            if budget and cost > budget:
+                self.report_error(GraphQLError(
+                    'Query cost {} exceeds budget of {}'.format(cost, budget), [node]
+                ))
+
+    return QueryCost
+
+
+class QueryCostExtension(Extension):
+    """Report query cost in response extensions."""
+
+    def format(self, context):
+        """Format cost."""
+        if context.cost:
+            return dict(cost=context.cost)
+        return None
@@ -0,0 +1,314 @@
+"""Instrumented database access."""
+from collections import defaultdict, deque
+from contextvars import ContextVar
+import asyncio
+import functools
+import hashlib
+import logging
+import random
+import re
+import time
+
+import databases
+
+
+LOGGER = logging.getLogger(__name__)
+DEFAULT_SLOW_SECONDS = 1.0
+SAMPLES = 1000
+PLANS = 100
+INTERACTIVE = 'interactive'
+ANALYTICS = 'analytics'
+BACKGROUND = 'background'
+# name:size:statement timeout in milliseconds (0 for none)
+DEFAULT_POOLS = 'interactive:10:10000,analytics:4:60000,background:2:0'
+WORKLOAD = ContextVar('workload', default=INTERACTIVE)
+EXPLAINABLE = re.compile(r'^\s*(select|with)\b(?!.*\b(insert|update|delete)\b)', re.IGNORECASE | re.DOTALL)
+NUMBERED_BIND = re.compile(r'(:\w+?)_\d+\b')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r'\s+')
+OR = re.compile(r'\s+or\s+', re.IGNORECASE)
+
+
+def parse_pools(value):
+    """Parse a pool specification into `{name: (size, statement timeout)}`."""
+    pools = {}
+    for spec in value.split(','):
+        name, size, timeout = spec.strip().split(':')
+        pools[name] = (int(size), int(timeout))
+    return pools
+
+
+def workload(name):
+    """Declare the workload class of a coroutine function.
+
+    Statements issued while it runs use the pool of that class, unless an
+    outer caller already chose a class other than interactive (for example
+    the cache warmer running everything in the background pool).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if WORKLOAD.get() != INTERACTIVE:
+                return await func(*args, **kwargs)
+            token = WORKLOAD.set(name)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                WORKLOAD.reset(token)
+        return wrapper
+    return decorator
+
+
+def fingerprint(query):
+    """Normalize a statement so that variants of the same query compare equal.
+
+    Literals become `?`, numbered binds from `compound_where` lose their
+    numbers and repeated OR terms collapse, so a lookup of any number of
+    compound keys has the same fingerprint.
+    """
+    query = WHITESPACE.sub(' ', str(query)).strip()
+    query = LITERAL.sub('?', NUMBERED_BIND.sub(r'\1_N', query))
+    parts = OR.split(query)
+    kept = parts[:1]
+    for i, part in enumerate(parts[1:-1], 1):
+        if not (kept[-1].endswith(part) and parts[i + 1].startswith(part)):
+            kept.append(part)
+    if len(parts) > 1:
+        kept.append(parts[-1])
+    return ' or '.join(kept)
+
+
+class Statistics:
+    """Latency and row counters per statement fingerprint.
+
+    Recording can be switched on and off at runtime. Optionally, a fraction
+    `explain_rate` of slow statements is explained and the plans kept in a
+    ring buffer.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        self.enabled = True
+        self.slow_seconds = DEFAULT_SLOW_SECONDS
+        self.explain_rate = 0
+        self.plans = deque(maxlen=PLANS)
+        self._explaining = False
+        self._fingerprints = {}
+        self._counters = defaultdict(lambda: dict(count=0, total_seconds=0, rows=0))
+        self._samples = defaultdict(lambda: deque(maxlen=SAMPLES))
+
+    def configure(self, enabled=None, slow_seconds=None, explain_rate=None):
+        """Change settings."""
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_seconds is not None:
+            self.slow_seconds = slow_seconds
+        if explain_rate is not None:
+            self.explain_rate = explain_rate
+
+    def observe(self, query, values, seconds, rows):
+        """Record an executed statement."""
+        statement = fingerprint(query)
+        key = hashlib.sha1(statement.encode('utf-8')).hexdigest()[:12]
+        self._fingerprints[key] = statement
+        counters = self._counters[key]
+        counters['count'] += 1
+        counters['total_seconds'] += seconds
+        counters['rows'] += rows
+        self._samples[key].append(seconds)
+        if seconds > self.slow_seconds:
+            LOGGER.warning("slow query (%.3fs, %d rows) %s: %s %s", seconds, rows, key, query, values)
+        return key
+
+    def should_explain(self, query, seconds):
+        """Decide whether to explain a statement.
+
+        Only one plan is captured at a time, since explaining runs the statement again.
+        """
+        if (seconds > self.slow_seconds and not self._explaining and random.random() < self.explain_rate and
+                isinstance(query, str) and EXPLAINABLE.match(query)):
+            self._explaining = True
+            return True
+        return False
+
+    async def explain(self, database, key, query, values, seconds):
+        """Capture a statement plan."""
+        try:
+            rows = await database.fetch_all('explain (analyze, buffers) ' + query, values=values)
+            plan = '\n'.join(row['QUERY PLAN'] for row in rows)
+        except Exception: # pylint: disable=broad-except
+            LOGGER.exception("failed to explain %s", key)
+            return
+        finally:
+            self._explaining = False
+        self.plans.append(dict(
+            fingerprint=key,
+            statement=fingerprint(query),
+            seconds=seconds,
+            values={
+                name: value if isinstance(value, (int, float, str, list)) else str(value)
+                for name, value in (values or {}).items()
+            },
+            captured=time.time(),
+            plan=plan
+        ))
+
+    def worst_plans(self, limit=10):
+        """Get captured plans, slowest first."""
+        return sorted(self.plans, key=lambda plan: plan['seconds'], reverse=True)[:limit]
+
+    def reset(self):
+        """Forget recorded statements."""
+        self._fingerprints.clear()
+        self._counters.clear()
+        self._samples.clear()
+
+    def collect(self):
+        """Get statistics for all statements."""
+        output = {}
+        for key, counters in self._counters.items():
+            samples = sorted(self._samples[key])
+            output[key] = dict(
+                counters,
+                statement=self._fingerprints[key],
+                avg_seconds=counters['total_seconds'] / counters['count'],
+                avg_rows=counters['rows'] / counters['count'],
+                p95_seconds=samples[int(0.95 * (len(samples) - 1))],
+                p99_seconds=samples[int(0.99 * (len(samples) - 1))]
+            )
+        return output
+
+    def status(self):
+        """Get settings."""
+        return dict(enabled=self.enabled, slow_seconds=self.slow_seconds, explain_rate=self.explain_rate)
+
+
+class Pool:
+    """A connection pool for one workload class.
+
+    Statements wait on a semaphore the size of the pool, so that waiting
+    time and saturation can be measured. An `observe` callback is passed
+    the seconds a statement took once it had a connection, and its result.
+    """
+
+    def __init__(self, database, size):
+        """Initialize."""
+        self.database = database
+        self.size = size
+        self._semaphore = None
+        self._in_use = 0
+        self._waiting = 0
+        self._counters = dict(acquisitions=0, wait_seconds=0, saturated=0)
+
+    async def run(self, method, query, values, observe=None):
+        """Run a statement on a pooled connection."""
+        if not self._semaphore:
+            self._semaphore = asyncio.Semaphore(self.size)
+        start = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_use += 1
+        self._counters['acquisitions'] += 1
+        self._counters['wait_seconds'] += time.perf_counter() - start
+        if self._in_use == self.size:
+            self._counters['saturated'] += 1
+        try:
+            if not observe:
+                return await getattr(self.database, method)(query, values=values)
+            start = time.perf_counter()
+            result = await getattr(self.database, method)(query, values=values)
+            observe(time.perf_counter() - start, result)
+            return result
+        finally:
+            self._in_use -= 1
+            self._semaphore.release()
+
+    def status(self):
+        """Get pool usage."""
+        return dict(
+            self._counters,
+            size=self.size,
+            in_use=self._in_use,
+            waiting=self._waiting,
+            utilization=self._in_use / self.size,
+            avg_wait_seconds=(
+                self._counters['wait_seconds'] / self._counters['acquisitions']
+                if self._counters['acquisitions'] else None
+            )
+        )
+
+
+class InstrumentedDatabase:
+    """Route statements to per-workload pools and time them.
+
+    Pools are `databases.Database` instances keyed by workload class. The
+    interactive pool serves unclassified work and anything else not
+    accessed through the fetch and execute methods.
+    """
+
+    def __init__(self, url, pools):
+        """Initialize."""
+        self.pools = {
+            name: Pool(databases.Database(
+                url, min_size=1, max_size=size,
+                server_settings={'statement_timeout': str(timeout)}
+            ), size) for name, (size, timeout) in pools.items()
+        }
+        self.default = self.pools[INTERACTIVE]
+
+    def __getattr__(self, name):
+        """Delegate everything else to the interactive pool."""
+        return getattr(self.default.database, name)
+
+    @property
+    def pool(self):
+        """Pool for the current workload."""
+        return self.pools.get(WORKLOAD.get(), self.default)
+
+    async def connect(self):
+        """Connect all pools."""
+        await asyncio.gather(*[pool.database.connect() for pool in self.pools.values()])
+
+    async def disconnect(self):
+        """Disconnect all pools."""
+        await asyncio.gather(*[pool.database.disconnect() for pool in self.pools.values()])
+
+    async def fetch_all(self, query, values=None):
+        """Fetch all rows."""
+        return await self._run('fetch_all', query, values, len)
+
+    async def fetch_one(self, query, values=None):
+        """Fetch one row."""
+        return await self._run('fetch_one', query, values, lambda row: int(row is not None))
+
+    async def execute(self, query, values=None):
+        """Execute a statement."""
+        return await self._run('execute', query, values, lambda _: 0)
+
+    def status(self):
+        """Get usage of all pools."""
+        return {name: pool.status() for name, pool in self.pools.items()}
+
+    async def _run(self, method, query, values, count_rows):
+        """Run a statement on the current pool, timing it once it has a connection."""
+        pool = self.pool
+        if not SQLStatistics.enabled:
+            return await pool.run(method, query, values)
+
+        def observe(seconds, result):
+            self._observe(pool, query, values, seconds, count_rows(result))
+
+        return await pool.run(method, query, values, observe)
+
+    @staticmethod
+    def _observe(pool, query, values, seconds, rows):
+        """Record a statement and maybe explain it in the background."""
+        key = SQLStatistics.observe(query, values, seconds, rows)
+        if SQLStatistics.should_explain(query, seconds):
+            asyncio.ensure_future(SQLStatistics.explain(pool.database, key, query, values, seconds))
+
+
+SQLStatistics = Statistics() # pylint: disable=invalid-name
@@ -0,0 +1,124 @@
+"""HTTP cache hints for GraphQL operations.
+
+A hint is the maximum age in seconds of a field and everything below it.
+Fields without a hint inherit from their parent, except root fields, which
+default to uncacheable. An operation may be cached for its smallest hint.
+
+Hints depending on arguments are computed by `DYNAMIC_HINTS`, and a root
+field resolving to null is uncacheable, since the value may appear later.
+"""
+import datetime
+
+from graphql import GraphQLError, get_named_type
+from graphql.execution.values import get_argument_values
+
+
+# Ingested matches do not change.
+IMMUTABLE = 86400
+# Reports for the current month change as matches are played.
+CURRENT_PERIOD = 300
+CACHE_HINTS = {
+    'Query.match': IMMUTABLE,
+    'Query.datasets': IMMUTABLE,
+    'Query.platforms': IMMUTABLE,
+    'Query.reports': IMMUTABLE,
+    'Query.report': IMMUTABLE,
+    'Query.stats': 2,
+    'Query.latest_summary': 2,
+    'Query.latest': 60,
+    'Query.search': 60,
+    'Query.search_options': 3600,
+    'Query.map': 3600,
+    'Query.maps': 3600,
+    'Query.civilization': 3600,
+    'Query.civilizations': 3600,
+    'Query.event': 3600,
+    'Query.events': 3600,
+    'Query.series': 3600,
+    'Query.person': 3600,
+    'Query.people': 3600,
+    'Query.user': 300,
+    'Query.meta_ladders': 300,
+    'Map.matches': 60,
+    'Civilization.matches': 60,
+    'User.matches': 60,
+    'Person.matches': 60,
+    # These change as matches are added, including below immutable matches.
+    'Match.odds': 1440,
+    'Match.map_events': 3600,
+    'Match.event': 3600,
+    'Match.tournament': 3600,
+    'Match.series': 3600,
+    'User.meta_ranks': 300,
+    'User.top_map': 3600,
+    'User.top_civilization': 3600,
+    'User.top_dataset': 3600,
+    'Person.match_count': 3600,
+    'Person.first_year': 3600,
+    'Person.last_year': 3600,
+    'Person.aliases': 3600,
+    'Person.accounts': 3600,
+    'Person.events': 3600,
+    'Civilization.count': 3600,
+    'Civilization.percent': 3600,
+    'Ladder.ranks': 300
+}
+
+
+def report_hint(args):
+    """Shorten the hint of reports for the current month, or later."""
+    today = datetime.date.today()
+    if (args.get('year'), args.get('month')) >= (today.year, today.month):
+        return CURRENT_PERIOD
+    return None
+
+
+DYNAMIC_HINTS = {
+    'Query.report': report_hint
+}
+
+
+def max_age(schema, document, operation, variables=None, data=None):
+    """Get the maximum age of a query operation's response.
+
+    Pass the response `data` once executed to account for null root fields.
+    """
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions if definition.kind == 'fragment_definition'
+    }
+
+    def walk(selection_set, parent_type, inherited):
+        age = IMMUTABLE
+        for selection in selection_set.selections:
+            if selection.kind == 'fragment_spread':
+                fragment = fragments.get(selection.name.value)
+                if fragment:
+                    age = min(age, walk(fragment.selection_set, parent_type, inherited))
+            elif selection.kind == 'inline_fragment':
+                age = min(age, walk(selection.selection_set, parent_type, inherited))
+            elif selection.name.value != '__typename':
+                field = getattr(parent_type, 'fields', {}).get(selection.name.value)
+                if not field:
+                    return 0
+                name = '{}.{}'.format(parent_type.name, selection.name.value)
+                field_age = CACHE_HINTS.get(name, inherited)
+                if name in DYNAMIC_HINTS:
+                    try:
+                        hint = DYNAMIC_HINTS[name](get_argument_values(field, selection, variables or {}))
+                    except GraphQLError:
+                        return 0
+                    if hint is not None:
+                        field_age = min(field_age, hint)
+                if parent_type is schema.query_type and data is not None:
+                    key = selection.alias.value if selection.alias else selection.name.value
+                    if data.get(key) is None:
+                        return 0
+                if selection.selection_set:
+                    field_age = min(field_age, walk(selection.selection_set, get_named_type(field.type), field_age))
+                age = min(age, field_age)
+        return age
+
+    if operation.operation.value != 'query':
+        return 0
+    return walk(operation.selection_set, schema.query_type, 0)
@@ -1,6 +1,7 @@
 """Civilizations."""
 import asyncio
 from aocrecs.cache import cached
+from aocrecs.database import workload, ANALYTICS
 
 
 @cached(ttl=None)
@@ -24,7 +25,8 @@ async def get_civilization(database, civilization_id, dataset_id):
     return dict(result, bonuses=list(map(dict, bonuses)))
 
 
-@cached(warm=[[0], [1], [100]], ttl=3600)
+@cached(warm=[[0], [1], [100]], ttl=3600, stale_ttl=3600)
+@workload(ANALYTICS)
 async def get_all_civilizations(database, dataset_id):
     """Get all civilizations."""
     query = """
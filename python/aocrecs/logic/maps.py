@@ -2,10 +2,13 @@
 import asyncio
 
 from aocrecs.cache import cached
+from aocrecs.database import workload, ANALYTICS
+from aocrecs.consts import MATCH_ADDED
 from aocrecs.util import by_key
 
 
-@cached(warm=True, ttl=3600)
+@cached(warm=True, ttl=3600, stale_ttl=3600, invalidate_on=[MATCH_ADDED])
+@workload(ANALYTICS)
 async def get_maps(database):
     """Get all maps."""
     query = """
@@ -56,6 +59,7 @@ async def get_map_events(keys, context):
 
 
 @cached(ttl=1440)
+@workload(ANALYTICS)
 async def get_top_civilizations(database, map_name, limit):
     """Get civilizations with most wins on a given map."""
     query = """
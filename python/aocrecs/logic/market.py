@@ -1,6 +1,6 @@
 """Market."""
 from aocrecs.cache import cached, dataloader_cached
-from aocrecs.util import by_key, compound_where
+from aocrecs.util import by_key, compound_in
 
 
 @cached(ttl=None)
@@ -22,7 +22,7 @@ async def get_prices(database, match_id):
 @dataloader_cached(ttl=None)
 async def get_transactions(keys, context):
     """Get transactions."""
-    where, values = compound_where(keys, ('players.match_id', 'player_number'))
+    where, values = compound_in(keys, ('players.match_id', 'player_number'))
     query = """
         select
             players.match_id, timestamp::interval(0), extract(epoch from timestamp)::integer as timestamp_secs,
@@ -0,0 +1,253 @@
+"""Materialized player flags.
+
+Flag queries scan `object_instances`, so running them inside searches is
+expensive. When enabled, the result of every flag in `playback.FLAGS` is
+stored per player in `match_flags` at ingest time, and searches and flag
+lookups read the table instead. Matches ingested elsewhere, such as by
+other processes, are materialized by a periodic refresh; until then,
+searches compute the flags of matches not materialized.
+
+Existing matches are backfilled with:
+
+    python -m aocrecs.logic.match_flags DATABASE_URL [BATCH] [CONCURRENCY]
+
+Enable reads with `MATCH_FLAGS` only once the backfill has finished, since
+searches only find matches present in the table.
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+from datetime import timedelta
+
+import databases
+
+from aocrecs.database import workload, BACKGROUND
+from aocrecs.logic import playback
+from aocrecs.logic.playback import FLAGS, FLAGS_VERSION
+from aocrecs.util import namespace_binds
+
+
+LOGGER = logging.getLogger(__name__)
+DEFAULT_BATCH = 100
+DEFAULT_CONCURRENCY = 4
+DEFAULT_FLAGS_REFRESH_SECONDS = 300
+FLAG_NAMES = {alias: name for alias, name, _, _ in FLAGS}
+FLAG_ORDER = {alias: i for i, (alias, _, _, _) in enumerate(FLAGS)}
+EVIDENCE_FLAGS = [alias for alias, _, use_evidence, _ in FLAGS if use_evidence]
+TABLES = [
+    """
+    create table if not exists match_flags (
+        match_id integer not null,
+        player_number integer not null,
+        flag_type varchar not null,
+        count integer not null,
+        evidence jsonb
+    )
+    """,
+    'create unique index if not exists match_flags_key on match_flags (match_id, player_number, flag_type)',
+    'create index if not exists match_flags_flag_type_match_id on match_flags (flag_type, match_id)',
+    """
+    create table if not exists match_flags_versions (
+        match_id integer primary key,
+        version varchar not null
+    )
+    """
+]
+# Condition on a match ID column that the match is not materialized.
+UNSTORED = 'not exists (select 1 from match_flags_versions as v where v.match_id={})'
+
+
+def materialize_query():
+    """Build the statement replacing the flags of a batch of matches.
+
+    Deleting, inserting and marking the batch happen in one statement, so
+    readers never see a partially materialized match. Rows conflicting
+    with existing ones, whether not yet deleted or inserted by a concurrent
+    materialization of the same match, are updated rather than duplicated.
+    """
+    selects = []
+    values = {}
+    for alias, _, use_evidence, (query, flag_values) in FLAGS:
+        if '{sq}' in query:
+            query = query.format(sq='select id from matches where id = any(:match_ids)')
+        query, flag_values = namespace_binds(alias, query, flag_values)
+        values.update(flag_values)
+        evidence = 'null::jsonb'
+        if use_evidence:
+            evidence = """jsonb_agg(jsonb_build_object(
+                'timestamp', extract(epoch from inside.timestamp), 'value', to_jsonb(inside)->'value'
+            ) order by inside.timestamp)"""
+        selects.append("""
+            select inside.match_id, inside.number, '{alias}', count(*), {evidence}
+            from ({query}) as inside
+            where inside.match_id = any(:match_ids)
+            group by inside.match_id, inside.number
+        """.format(alias=alias, evidence=evidence, query=query))
+    query = """
+        with removed as (
+            delete from match_flags where match_id = any(:match_ids)
+        ), versions as (
+            insert into match_flags_versions (match_id, version)
+            select unnest(cast(:match_ids as integer[])), :version
+            on conflict (match_id) do update set version=excluded.version
+        )
+        insert into match_flags (match_id, player_number, flag_type, count, evidence)
+        {}
+        on conflict (match_id, player_number, flag_type) do update set count=excluded.count, evidence=excluded.evidence
+    """.format(' union all '.join(selects))
+    return query, dict(values, version=FLAGS_VERSION)
+
+
+class FlagTable:
+    """Materialize flags and read them back."""
+
+    def __init__(self):
+        """Initialize."""
+        self.enabled = False
+        self._database = None
+
+    def configure(self, enabled=None, database=None):
+        """Change settings."""
+        if enabled is not None:
+            self.enabled = enabled
+        if database is not None:
+            self._database = database
+
+    async def setup(self):
+        """Create tables if enabled."""
+        if not self.enabled:
+            LOGGER.info("materialized flags are disabled")
+            return
+        if not self._database:
+            raise RuntimeError('configure with database prior to setup')
+        await self.create(self._database)
+
+    @staticmethod
+    async def create(database):
+        """Create tables if needed."""
+        for statement in TABLES:
+            await database.execute(statement)
+
+    @workload(BACKGROUND)
+    async def materialize(self, database, match_ids):
+        """Replace stored flags of matches."""
+        query, values = materialize_query()
+        start = time.time()
+        await database.execute(query, values=dict(values, match_ids=list(match_ids)))
+        LOGGER.debug("materialized flags of %d matches in %f", len(match_ids), time.time() - start)
+
+    async def on_match_added(self, database, match_id):
+        """Materialize flags of a new match, if enabled."""
+        if not self.enabled:
+            return
+        try:
+            await self.materialize(database, [match_id])
+        except Exception: # pylint: disable=broad-except
+            LOGGER.exception("failed to materialize flags of match %d", match_id)
+
+    @workload(BACKGROUND)
+    async def refresh(self, database, batch=DEFAULT_BATCH):
+        """Materialize matches added without flags, such as by other processes.
+
+        Matches stored with other flag definitions are left to the backfill.
+        """
+        match_ids = await self.unstored(database, outdated=False)
+        for i in range(0, len(match_ids), batch):
+            await self.materialize(database, match_ids[i:i + batch])
+        if match_ids:
+            LOGGER.info("materialized flags of %d matches", len(match_ids))
+
+    @staticmethod
+    async def stored(database, match_ids):
+        """Get matches materialized with the current flag definitions."""
+        query = 'select match_id from match_flags_versions where match_id = any(:match_ids) and version=:version'
+        rows = await database.fetch_all(query, values=dict(match_ids=list(match_ids), version=FLAGS_VERSION))
+        return {row['match_id'] for row in rows}
+
+    @staticmethod
+    async def unstored(database, outdated=True):
+        """Get matches not materialized, including those stored with other flag definitions if `outdated`."""
+        query = """
+            select id from matches
+            where not exists (
+                select 1 from match_flags_versions as v where v.match_id=matches.id {}
+            )
+            order by id
+        """.format('and v.version=:version' if outdated else '')
+        values = dict(version=FLAGS_VERSION) if outdated else {}
+        return [row['id'] for row in await database.fetch_all(query, values=values)]
+
+    async def backfill(self, database, batch=DEFAULT_BATCH, concurrency=DEFAULT_CONCURRENCY):
+        """Materialize all matches not stored with the current flag definitions."""
+        await self.create(database)
+        match_ids = await self.unstored(database)
+        batches = [match_ids[i:i + batch] for i in range(0, len(match_ids), batch)]
+        LOGGER.info("backfilling flags of %d matches in %d batches", len(match_ids), len(batches))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(i, match_ids):
+            async with semaphore:
+                await self.materialize(database, match_ids)
+                LOGGER.info("backfilled batch %d/%d", i + 1, len(batches))
+
+        await asyncio.gather(*[run(i, b) for i, b in enumerate(batches)])
+
+
+async def get_player_flags(keys, context):
+    """Get flagged player events.
+
+    Matches not yet materialized, or materialized with other flag
+    definitions, are computed with `playback.get_flags`.
+    """
+    if not MatchFlags.enabled:
+        return await playback.get_flags(keys, context)
+    stored = await MatchFlags.stored(context.database, {k[0] for k in keys})
+    results = {k: [] for k in keys if k[0] in stored}
+    missing = [k for k in keys if k[0] not in stored]
+    if stored:
+        query = """
+            select match_id, player_number, flag_type, count, evidence
+            from match_flags
+            where match_id = any(:match_ids) and flag_type = any(:flag_types)
+        """
+        rows = await context.database.fetch_all(query, values=dict(match_ids=list(stored), flag_types=EVIDENCE_FLAGS))
+        for row in sorted(rows, key=lambda r: FLAG_ORDER[r['flag_type']]):
+            key = (row['match_id'], row['player_number'])
+            if key not in results:
+                continue
+            results[key].append(dict(
+                type=row['flag_type'],
+                name=FLAG_NAMES[row['flag_type']],
+                count=row['count'],
+                evidence=[
+                    dict(timestamp=timedelta(seconds=e['timestamp']), value=e['value'])
+                    for e in json.loads(row['evidence'] or '[]')
+                ]
+            ))
+    if missing:
+        results.update(await playback.get_flags(missing, context))
+    return results
+
+
+MatchFlags = FlagTable() # pylint: disable=invalid-name
+
+
+async def main(url, batch, concurrency):
+    """Backfill existing matches."""
+    database = databases.Database(url, min_size=1, max_size=concurrency)
+    await database.connect()
+    try:
+        await MatchFlags.backfill(database, batch, concurrency)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    asyncio.run(main(
+        sys.argv[1],
+        int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_BATCH,
+        int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_CONCURRENCY
+    ))
@@ -2,7 +2,7 @@
 import asyncio
 
 from aocrecs.cache import cached, dataloader_cached
-from aocrecs.util import by_key, compound_where
+from aocrecs.util import by_key, compound_in
 
 
 @cached(ttl=None)
@@ -26,7 +26,7 @@ async def get_chat(database, match_id):
 @dataloader_cached(ttl=None)
 async def get_research_by_player(keys, context):
     """Get researches."""
-    where, values = compound_where(keys, ('match_id', 'player_number'))
+    where, values = compound_in(keys, ('match_id', 'player_number'))
     query = """
         select name, started::interval(0), finished::interval(0), player_number, match_id,
         extract(epoch from started)::integer as started_secs, extract(epoch from finished)::integer as finished_secs
@@ -91,7 +91,7 @@ def make_files(player_data, file_data, match_id):
 @dataloader_cached(ttl=None)
 async def get_player(keys, context):
     """Get basic player data."""
-    where, values = compound_where(keys, ('match_id', 'number'))
+    where, values = compound_in(keys, ('match_id', 'number'))
     query = """
         select
             players.match_id, players.number, players.name, players.winner,  players.color_id,
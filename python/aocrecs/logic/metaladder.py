@@ -2,9 +2,11 @@
 import datetime
 from aocrecs.consts import COLLECTION_STARTED
 from aocrecs.cache import cached
+from aocrecs.database import workload, ANALYTICS
 
 
-@cached(warm=[[None, 'voobly', 131], [None, 'voobly', 132], [None, 'voobly', 163], [None, 'de', 3], [None, 'de', 4]], ttl=86400)
+@cached(warm=[[None, 'voobly', 131], [None, 'voobly', 132], [None, 'voobly', 163], [None, 'de', 3], [None, 'de', 4]], ttl=86400, stale_ttl=86400)
+@workload(ANALYTICS)
 async def compute_ranks(database, filters, platform_id, ladder_id):
     """Compute ranks of all ladder participants."""
     part_1 = """
@@ -28,7 +30,7 @@ async def compute_ranks(database, filters, platform_id, ladder_id):
     if filters:
         part_1 += " and " + filters[0]
         values.update(filters[1])
-    return await database.fetch_all(part_1 + part_2, values=values)
+    return list(map(dict, await database.fetch_all(part_1 + part_2, values=values)))
 
 
 async def compute_rank(database, user_id, filters, platform_id, ladder_id):
@@ -57,7 +59,7 @@ async def get_meta_ranks(database, user_id, platform_id, ladder_ids):
     return ranks
 
 
-@cached(warm=True, ttl=None)
+@cached(warm=[['de', [3, 4]]], ttl=None)
 async def get_ladders(database, platform_id, ladder_ids):
     """Get platform ladders."""
     query = 'select id, platform_id, name from ladders where platform_id=:platform_id and id = any(:ladder_ids)'
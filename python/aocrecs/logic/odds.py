@@ -6,7 +6,8 @@ import time
 from collections import defaultdict
 
 from aocrecs.cache import cached
-from aocrecs.util import by_key, compound_where
+from aocrecs.database import workload, ANALYTICS
+from aocrecs.util import by_key, compound_in
 
 
 LOGGER = logging.getLogger(__name__)
@@ -52,6 +53,7 @@ async def get_odds(database, params):
 
 
 @cached(ttl=1440)
+@workload(ANALYTICS)
 async def odds_query(database, teams, type_id, match_filters=None, civ_filter=False, user_filter=False): # pylint: disable=too-many-arguments, too-many-locals
     """Run a query with odds constraints."""
     start_time = time.time()
@@ -66,7 +68,10 @@ async def odds_query(database, teams, type_id, match_filters=None, civ_filter=Fa
         if user_filter and civ_filter:
             key = 'civilization_id'
             keys = [(p['user_id'], p['civilization_id']) for p in team]
-            player_filters, player_values = compound_where(keys, ('players.user_id', 'players.civilization_id'))
+            player_filters, player_values = compound_in(
+                keys, ('players.user_id', 'players.civilization_id'),
+                types=('varchar', 'integer'), prefix='t{}_'.format(i)
+            )
             values.update(player_values)
 
         elif civ_filter:
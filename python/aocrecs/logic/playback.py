@@ -2,8 +2,9 @@
 import asyncio
 from collections import defaultdict
 
-from aocrecs.cache import cached, dataloader_cached
-from aocrecs.util import by_key, compound_where
+from aocrecs.cache import cached, dataloader_cached, digest
+from aocrecs.database import workload, ANALYTICS
+from aocrecs.util import by_key, compound_in
 from aocrecs.logic import flags, metrics
 
 from aocrecs.consts import (
@@ -55,9 +56,12 @@ METRICS = [
     ('seconds_popcapped', metrics.popcapped()),
     ('apm', metrics.apm())
 ]
+FLAGS_VERSION = digest(FLAGS)
+METRICS_VERSION = digest(METRICS)
 
 
-@cached(ttl=None)
+@cached(ttl=None, persist=True)
+@workload(ANALYTICS)
 async def get_graph(database, match_id):
     """Get kill-graph nodes and edges."""
     node_query = """
@@ -95,10 +99,11 @@ async def get_graph(database, match_id):
     )
 
 
-@dataloader_cached(ttl=None)
+@dataloader_cached(ttl=None, persist=True)
+@workload(ANALYTICS)
 async def get_timeseries(keys, context):
     """Get timeseries data."""
-    where, values = compound_where(keys, ('match_id', 'player_number'))
+    where, values = compound_in(keys, ('match_id', 'player_number'))
     query = """
         select
             player_number, match_id, timestamp, population, military,
@@ -118,7 +123,8 @@ async def get_timeseries(keys, context):
     return by_key(results, ('match_id', 'player_number'))
 
 
-@dataloader_cached(ttl=None)
+@dataloader_cached(ttl=None, persist=True)
+@workload(ANALYTICS)
 async def get_apm(keys, context):
     """Compute actions per minute."""
     query = """
@@ -146,7 +152,8 @@ async def get_apm(keys, context):
     return by_key(results, ('match_id', 'player_number'))
 
 
-@dataloader_cached(ttl=None)
+@dataloader_cached(ttl=None, persist=True)
+@workload(ANALYTICS)
 async def get_map_control(keys, context):
     """Get estimated map control from actions."""
     query = """
@@ -188,9 +195,10 @@ async def get_map_control(keys, context):
 
 
 @dataloader_cached(ttl=None)
+@workload(ANALYTICS)
 async def get_units_trained(keys, context):
     """Get counts of units trained bucketed by interval."""
-    where, values = compound_where(keys, ('match_id', 'player_number'))
+    where, values = compound_in(keys, ('match_id', 'player_number'))
     query = """
         select player_number, x.match_id, objects.id as object_id, name, count, inter as timestamp, extract(epoch from inter)::integer as timestamp_secs
         from
@@ -220,7 +228,8 @@ async def get_units_trained(keys, context):
     return by_key(results, ('match_id', 'player_number'))
 
 
-@dataloader_cached(ttl=None)
+@dataloader_cached(ttl=None, persist=FLAGS_VERSION)
+@workload(ANALYTICS)
 async def get_flags(keys, context): # pylint: disable=too-many-locals
     """Get flagged player events."""
     results = {}
@@ -268,7 +277,8 @@ async def get_flags(keys, context): # pylint: disable=too-many-locals
     return results
 
 
-@dataloader_cached(ttl=None)
+@dataloader_cached(ttl=None, persist=METRICS_VERSION)
+@workload(ANALYTICS)
 async def get_metrics(keys, context):
     """Get player metrics."""
     queries = []
@@ -319,21 +329,24 @@ async def object_count_query(database, match_ids, object_ids):
 
 
 @dataloader_cached(ttl=None)
+@workload(ANALYTICS)
 async def get_trade_carts(keys, context):
     """Get trade cart counts by interval."""
     return await object_count_query(context.database, [k[0] for k in keys], [128])
 
 
 @dataloader_cached(ttl=None)
+@workload(ANALYTICS)
 async def get_villagers(keys, context):
     """Get villager counts by interval."""
     return await object_count_query(context.database, [k[0] for k in keys], VILLAGER_IDS)
 
 
-@dataloader_cached(ttl=None)
+@dataloader_cached(ttl=None, persist=True)
+@workload(ANALYTICS)
 async def get_villager_allocation(keys, context):
     """Get villager allocation per player bucketed by interval."""
-    where, values = compound_where(keys, ('match_id', 'player_number'))
+    where, values = compound_in(keys, ('match_id', 'player_number'))
     query = """
         select
             vils.match_id, vils.player_number, vils.res as name, buckets.inter as timestamp,
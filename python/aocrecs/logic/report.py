@@ -5,6 +5,7 @@ from dateutil.relativedelta import relativedelta
 from aocrecs.consts import COLLECTION_STARTED
 from aocrecs.logic.metaladder import compute_ranks
 from aocrecs.cache import cached
+from aocrecs.database import workload, ANALYTICS
 
 
 LAST_MONTH = datetime.datetime.today() - relativedelta(months=+1)
@@ -76,6 +77,7 @@ async def rankings(database, platform_id, ladder_id, year, month, limit): # pyli
     ['voobly', 131, LAST_MONTH.year, LAST_MONTH.month, 25],
     ['voobly', 132, LAST_MONTH.year, LAST_MONTH.month, 25]
 ], ttl=None)
+@workload(ANALYTICS)
 async def most_improvement(database, platform_id, ladder_id, year, month, limit): # pylint: disable=too-many-arguments
     """Get most improvement for report interval."""
     query = """
@@ -105,6 +107,7 @@ async def most_improvement(database, platform_id, ladder_id, year, month, limit)
 
 
 @cached(warm=[[LAST_MONTH.year, LAST_MONTH.month, 25]], ttl=None)
+@workload(ANALYTICS)
 async def report(database, year, month, limit):
     """Get a report."""
     matches_query = """
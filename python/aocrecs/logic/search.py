@@ -1,16 +1,50 @@
 """Build search query."""
 import asyncio
-from datetime import datetime
+import base64
+import binascii
+import json
+from collections import defaultdict
+from datetime import date, datetime, timedelta
 from aocrecs.cache import cached
+from aocrecs.database import workload, ANALYTICS
+from aocrecs.consts import MATCH_ADDED
 from aocrecs.logic import matches
+from aocrecs.logic.match_flags import MatchFlags, UNSTORED
 from aocrecs.logic.playback import FLAGS
+from aocrecs.logic.search_index import SearchIndex
+from aocrecs.util import namespace_binds
 
 
 SEARCH_LIMIT = 10
 LATEST_DATASETS = [0, 1, 100]
+FACET_FIELDS = [
+    'matches.dataset_id', 'matches.dataset_version', 'matches.platform_id', 'matches.ladder_id',
+    'matches.map_name', 'matches.diplomacy_type', 'matches.type_id', 'matches.rated',
+    'matches.mirror', 'matches.team_size', 'players.civilization_id'
+]
 
 
-@cached(warm=True, ttl=86400)
+def search_affected(payload, arguments):
+    """Check whether a new match can change the results of a cached search.
+
+    Searches restricted to values of the dataset, platform, map or
+    civilizations other than those of the match are unaffected.
+    """
+    params = arguments.get('params', {})
+    added = [
+        ('matches', 'dataset_id', [payload['dataset_id']]),
+        ('matches', 'platform_id', [payload['platform_id']]),
+        ('matches', 'map_name', [payload['map_name']]),
+        ('players', 'civilization_id', [player['civilization_id'] for player in payload['players']])
+    ]
+    for table, field, values in added:
+        criteria = params.get(table, {}).get(field, {})
+        if 'values' in criteria and not {str(v) for v in values} & {str(v) for v in criteria['values']}:
+            return False
+    return True
+
+
+@cached(warm=True, ttl=86400, invalidate_on=[MATCH_ADDED])
 async def _latest_versions(database):
     latest = []
     query = """
@@ -19,10 +53,10 @@ async def _latest_versions(database):
         where dataset_id = any(:dataset_ids)
         group by dataset_id, datasets.name, datasets.short
     """
-    return await database.fetch_all(query, values=dict(dataset_ids=LATEST_DATASETS))
+    return list(map(dict, await database.fetch_all(query, values=dict(dataset_ids=LATEST_DATASETS))))
 
 
-@cached(warm=True, ttl=2)
+@cached(warm=True, ttl=2, invalidate_on=[MATCH_ADDED])
 async def latest_summary(database):
     latest = []
     datasets = await _latest_versions(database)
@@ -50,32 +84,220 @@ async def latest_summary(database):
 
 
 #@cached(warm=[[0, 0, 8], [1, 0, 8], [100, 0, 8]], ttl=3600)
-async def latest(context, dataset_id, order, offset, limit):
+async def latest(context, dataset_id, order, offset, limit, cursor=None):
     query = "select max(dataset_version) as version from matches where dataset_id=:dataset_id"
     result = await context.database.fetch_one(query, values=dict(dataset_id=dataset_id))
     params = {'matches': {
         'dataset_id': {'values': [dataset_id]},
         'dataset_version': {'values': [result['version']]}
     }}
-    return await get_hits(context, params, order, offset, limit)
+    return await get_hits(context, params, order, offset, limit, cursor)
 
 
-async def get_hits(context, params, order, offset, limit):
-    """Return hits: count and paginated matches."""
-    count, result = await _cached_get_hits(context.database, params, order, offset, limit)
-    return dict(count=count['count'], hits=await context.load_many(matches.get_match, map(lambda m: m['id'], result)))
+async def get_hits(context, params, order, offset, limit, cursor=None):
+    """Return hits: paginated matches and the cursor of the next page.
 
+    With a cursor, the page starts after the cursor position and `offset` is ignored.
+    The count is resolved separately by `get_count`, only when requested.
+    Searches supported by the in-memory index don't query the database.
+    """
+    if SearchIndex.supports(params, order):
+        result, next_cursor = _indexed_hits(params, offset, limit, cursor)
+    else:
+        result, next_cursor = await _cached_get_hits(context.database, params, order, offset, limit, cursor)
+    return dict(
+        params=params,
+        hits=await context.load_many(matches.get_match, map(lambda m: m['id'], result)),
+        next_cursor=next_cursor
+    )
 
-@cached()
-async def _cached_get_hits(database, params, order, offset, limit):
+
+@cached(invalidate_on={MATCH_ADDED: search_affected})
+async def _cached_get_hits(database, params, order, offset, limit, cursor=None):
     """Cacheable hits."""
     if limit > SEARCH_LIMIT:
         limit = SEARCH_LIMIT
-    result_query, count_query, values = build_query(params, order, offset, limit)
-    return await asyncio.gather(
-        database.fetch_one(count_query, values=values),
-        database.fetch_all(result_query, values=values)
-    )
+    result_query, _, values = build_query(params, order, offset, limit, cursor)
+    result = await database.fetch_all(result_query, values=values)
+    next_cursor = encode_cursor(list(result[-1].values())) if result and len(result) == limit else None
+    return [dict(row) for row in result], next_cursor
+
+
+def _indexed_hits(params, offset, limit, cursor=None):
+    """Hits from the in-memory index, which supports only orders by play date."""
+    if limit > SEARCH_LIMIT:
+        limit = SEARCH_LIMIT
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if len(after) != 2:
+            raise ValueError('cursor does not match order')
+        if not (after[0] is None or isinstance(after[0], datetime)) or not isinstance(after[1], int):
+            raise ValueError('invalid cursor')
+    rows = SearchIndex.page(SearchIndex.matching(params), offset if not cursor else 0, limit, after)
+    next_cursor = encode_cursor(list(rows[-1])) if rows and len(rows) == limit else None
+    return [dict(played=played, id=match_id) for played, match_id in rows], next_cursor
+
+
+async def get_count(database, params, cap=None):
+    """Count matching matches, shared by all pages of a search.
+
+    With a cap, counting stops after `cap` matches and `capped` is set.
+    """
+    if cap is not None and cap < 0:
+        raise ValueError('cap must not be negative')
+    if SearchIndex.supports(params):
+        count = len(SearchIndex.matching(params))
+        if cap is None:
+            return dict(count=count, capped=False)
+        return dict(count=min(count, cap), capped=count > cap)
+    return await _cached_get_count(database, params, cap)
+
+
+@cached(invalidate_on={MATCH_ADDED: search_affected})
+@workload(ANALYTICS)
+async def _cached_get_count(database, params, cap=None):
+    """Cacheable count."""
+    query, values, _ = build_filter(params)
+    if cap is None:
+        result = await database.fetch_one('select count(distinct matches.id) {}'.format(query), values=values)
+        return dict(count=result['count'], capped=False)
+    capped_query = 'select count(*) from (select distinct matches.id {} limit :count_cap) as capped'.format(query)
+    result = await database.fetch_one(capped_query, values=dict(values, count_cap=cap + 1))
+    return dict(count=min(result['count'], cap), capped=result['count'] > cap)
+
+
+def counts_key(params, fields=()):
+    """Loader key of the counts of a search."""
+    for field in fields:
+        if field not in FACET_FIELDS:
+            raise ValueError('facet not supported: {}'.format(field))
+    return json.dumps(params, sort_keys=True), tuple(fields)
+
+
+async def get_counts(keys, context):
+    """Get the count and per-value facet counts of searches.
+
+    Keys of the same search, such as its `count` and `facets`, are computed
+    together in one pass.
+    """
+    fields = defaultdict(set)
+    for params, key_fields in keys:
+        fields[params].update(key_fields)
+    searches = list(fields.keys())
+    results = dict(zip(searches, await asyncio.gather(*[
+        _get_counts(context.database, json.loads(params), sorted(fields[params])) for params in searches
+    ])))
+    return {(params, key_fields): dict(
+        count=results[params]['count'],
+        facets=[dict(field=field, values=results[params]['facets'][field]) for field in key_fields]
+    ) for params, key_fields in keys}
+
+
+async def _get_counts(database, params, fields):
+    """Counts from the in-memory index if supported, otherwise from the database."""
+    if SearchIndex.supports(params, fields=fields):
+        bitmap = SearchIndex.matching(params)
+        return dict(count=len(bitmap), facets={field: [
+            dict(value=value, count=count) for value, count in SearchIndex.facets(bitmap, field)
+        ] for field in fields})
+    return await _cached_get_counts(database, params, fields)
+
+
+def facet_column(params, field):
+    """Column to group a facet by.
+
+    A facet counts matching matches having each value, so a table with
+    criteria is grouped by its unfiltered join: with criteria on players,
+    the civilizations of all players of matching matches are counted, as
+    with the in-memory index.
+    """
+    table, _, column = field.partition('.')
+    if table != 'matches' and params.get(table):
+        return 'unfiltered_{}.{}'.format(table, column)
+    return field
+
+
+@cached(invalidate_on={MATCH_ADDED: search_affected})
+@workload(ANALYTICS)
+async def _cached_get_counts(database, params, fields):
+    """Count matches in total and per facet value, with grouping sets."""
+    query, values, _ = build_filter(params, tables={field.split('.')[0] for field in fields})
+    columns = ['count(distinct matches.id) as count']
+    groups = [facet_column(params, field) for field in fields]
+    for i, group in enumerate(groups):
+        columns.append('{0} as facet_{1}, grouping({0}) as grouped_{1}'.format(group, i))
+    query = 'select {} {}'.format(', '.join(columns), query)
+    if fields:
+        query += ' group by grouping sets ((), {})'.format(', '.join('({})'.format(group) for group in groups))
+    count = 0
+    facets = {field: [] for field in fields}
+    for row in await database.fetch_all(query, values=values):
+        grouped = [i for i in range(len(fields)) if row['grouped_{}'.format(i)] == 0]
+        if not grouped:
+            count = row['count']
+        elif row['facet_{}'.format(grouped[0])] is not None:
+            facets[fields[grouped[0]]].append(dict(value=row['facet_{}'.format(grouped[0])], count=row['count']))
+    for counts in facets.values():
+        counts.sort(key=lambda value: value['count'], reverse=True)
+    return dict(count=count, facets=facets)
+
+
+def encode_cursor(values):
+    """Encode a row position as an opaque cursor."""
+    def tag(value):
+        if isinstance(value, datetime):
+            return {'datetime': value.isoformat()}
+        if isinstance(value, date):
+            return {'date': value.isoformat()}
+        if isinstance(value, timedelta):
+            return {'timedelta': value.total_seconds()}
+        return value
+    return base64.urlsafe_b64encode(json.dumps([tag(v) for v in values]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into row position values."""
+    def untag(value):
+        if isinstance(value, dict):
+            if 'datetime' in value:
+                return datetime.fromisoformat(value['datetime'])
+            if 'date' in value:
+                return date.fromisoformat(value['date'])
+            if 'timedelta' in value:
+                return timedelta(seconds=value['timedelta'])
+        return value
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list):
+            raise TypeError('cursor is not a list')
+        return [untag(v) for v in values]
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise ValueError('invalid cursor')
+
+
+def keyset_filter(fields, values, args):
+    """Filter rows after a position in `order by` each field descending, then `matches.id` descending.
+
+    The last order field sorts nulls last and the others nulls first, matching `build_query`.
+    """
+    terms = []
+    equal = []
+    for i, (field, value) in enumerate(zip(fields, values)):
+        bind = 'cursor_{}'.format(i)
+        nulls_last = i == len(fields) - 2
+        if value is None:
+            after = None if nulls_last else '{} is not null'.format(field)
+            equal.append('{} is null'.format(field))
+        else:
+            args[bind] = value
+            after = '{0} < :{1}'.format(field, bind)
+            if nulls_last:
+                after = '({} or {} is null)'.format(after, field)
+            equal.append('{} = :{}'.format(field, bind))
+        if after:
+            terms.append(' and '.join(equal[:-1] + [after]))
+    return '({})'.format(' or '.join('({})'.format(t) for t in terms) if terms else 'false')
 
 
 def add_filter(field, bind, criteria):
@@ -91,14 +313,20 @@ def add_filter(field, bind, criteria):
     raise ValueError('criteria not supported')
 
 
-def build_query(params, order, offset, limit):
-    """Build search query."""
+def build_filter(params, tables=()):
+    """Build the `from` and `where` clauses of a search, with bind values.
+
+    Additional `tables` are joined even without criteria on them, and those
+    with criteria are joined a second time, unfiltered, as `unfiltered_<table>`.
+    """
     join = []
     where = []
     args = {}
     for table in ['players', 'files', 'matches']:
-        if table != 'matches' and table in params.keys() and params[table]:
+        if table != 'matches' and (params.get(table) or table in tables):
             join.append('{0} on {0}.match_id=matches.id'.format(table))
+        if table != 'matches' and params.get(table) and table in tables:
+            join.append('{0} as unfiltered_{0} on unfiltered_{0}.match_id=matches.id'.format(table))
 
         for field, criteria in params.get(table, {}).items():
             path = '{}.{}'.format(table, field)
@@ -111,37 +339,58 @@ def build_query(params, order, offset, limit):
     if where:
         query += ' where {}'.format(' and '.join(where))
 
-    query = append_flags(query, params, args)
+    return append_flags(query, params, args), args, bool(where)
 
-    order_by = []
-    selected = ['matches.id']
-    if not order:
-        order_by.append('matches.played desc')
-        selected.append('matches.played')
-    else:
-        for field in order:
-            order_by.append('{} desc'.format(field))
-            selected.append(field)
-    query_template = "select distinct {} {} order by {} nulls last limit {} offset {}"
-    return query_template.format(', '.join(selected), query, ', '.join(order_by), limit, offset), 'select count(distinct matches.id) {}'.format(query), args
+
+def build_query(params, order, offset, limit, cursor=None):
+    """Build search query.
+
+    Results are ordered by the order fields descending, with ties broken by
+    match ID, so that a cursor identifies a unique position.
+    """
+    query, args, where = build_filter(params)
+    count_query = 'select count(distinct matches.id) {}'.format(query)
+
+    fields = order or ['matches.played']
+    order_by = ['{} desc'.format(field) for field in fields]
+    order_by[-1] += ' nulls last'
+    order_by.append('matches.id desc')
+    if cursor:
+        position = decode_cursor(cursor)
+        if len(position) != len(fields) + 1:
+            raise ValueError('cursor does not match order')
+        query += ' {} {}'.format('and' if where else 'where', keyset_filter(fields + ['matches.id'], position, args))
+        offset = 0
+    query_template = "select distinct {} {} order by {} limit {} offset {}"
+    hits_query = query_template.format(', '.join(fields + ['matches.id']), query, ', '.join(order_by), limit, offset)
+    return hits_query, count_query, args
 
 
 def append_flags(query, params, args):
-    """Append flag logic."""
+    """Append flag logic.
+
+    With materialized flags, matches are looked up in `match_flags` rather
+    than computing each flag, except for matches not yet materialized.
+    """
     joins = []
     for alias, _, _, (subquery, values) in FLAGS:
         if alias not in params.get('flags', {}).keys():
             continue
 
         if '{sq}' in subquery:
-            subquery = subquery.format(sq='select distinct matches.id {}'.format(query.format(playback='')))
-
-        new_args = {}
-        for key, value in values.items():
-            subquery = subquery.replace(':{}'.format(key), ':{}_{}'.format(alias, key))
-            new_args['{}_{}'.format(alias, key)] = value
+            if MatchFlags.enabled:
+                subquery = subquery.format(sq='select id from matches where {}'.format(UNSTORED.format('matches.id')))
+            else:
+                subquery = subquery.format(sq='select distinct matches.id {}'.format(query.format(playback='')))
 
+        subquery, new_args = namespace_binds(alias, subquery, values)
         args.update(new_args)
+        if MatchFlags.enabled:
+            args['{}_flag_type'.format(alias)] = alias
+            subquery = (
+                'select match_id from match_flags where flag_type=:{alias}_flag_type '
+                'union select match_id from ({subquery}) as computed where {unstored}'
+            ).format(alias=alias, subquery=subquery, unstored=UNSTORED.format('computed.match_id'))
         joins.append('({subquery}) as {alias} on {alias}.match_id = matches.id'.format(subquery=subquery, alias=alias))
 
     if joins:
@@ -0,0 +1,292 @@
+"""In-memory index of match attributes.
+
+Searches filtering only on low-cardinality columns and ordered by play
+date are answered from bitmaps of match ordinals per column value. Matches
+are numbered in `played, id` order, so iterating ordinals downwards yields
+`played desc nulls last, id desc` like the SQL search.
+
+Matches added later than others played after them are numbered out of
+order. Their positions are kept sorted on the side and merged into pages.
+
+Each worker holds its own index. With the persistent store enabled, the
+matches fetched by one worker's refresh are shared with the others, so the
+database is queried once per refresh interval rather than once per worker.
+"""
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from aocrecs.bitmap import Bitmap
+from aocrecs.cache import CacheStore, FileLock
+from aocrecs.database import workload, BACKGROUND
+
+
+LOGGER = logging.getLogger(__name__)
+MATCH_FIELDS = [
+    'dataset_id', 'dataset_version', 'platform_id', 'ladder_id', 'map_name',
+    'diplomacy_type', 'rated', 'mirror', 'team_size'
+]
+PLAYER_FIELDS = ['civilization_id']
+ORDERS = [None, ['matches.played']]
+# Matches indexed between yields to the event loop.
+YIELD_EVERY = 10000
+DEFAULT_REFRESH_SECONDS = 60
+SHARED_NAMESPACE = 'aocrecs.logic.search_index'
+
+
+def position(played, match_id):
+    """Sort key of a match, with unknown play dates first."""
+    return (0, match_id) if played is None else (1, played, match_id)
+
+
+class MatchIndex:
+    """Bitmaps of match ordinals per column value."""
+
+    def __init__(self):
+        """Initialize."""
+        self.enabled = False
+        self.ready = False
+        self._database = None
+        self._lock = None
+        self._task = None
+        self._fetched = 0
+        self._ids = []
+        self._played = []
+        self._max_id = 0
+        self._all = Bitmap()
+        self._late = Bitmap()
+        self._late_positions = []
+        self._last = None
+        self._bitmaps = defaultdict(lambda: defaultdict(Bitmap))
+
+    def configure(self, enabled=None, database=None):
+        """Change settings."""
+        if enabled is not None:
+            self.enabled = enabled
+        if database is not None:
+            self._database = database
+
+    async def setup(self):
+        """Start loading the index, if enabled."""
+        if not self.enabled:
+            LOGGER.info("search index is disabled")
+            return
+        if not self._database:
+            raise RuntimeError('configure with database prior to setup')
+        self._task = asyncio.ensure_future(self.refresh(self._database))
+
+    async def teardown(self):
+        """Stop loading."""
+        if self._task:
+            self._task.cancel()
+
+    async def on_match_added(self, database, match_id):
+        """Schedule indexing of new matches, if enabled."""
+        if not self.enabled:
+            return
+        asyncio.ensure_future(self.refresh(database)).add_done_callback(functools.partial(self._refreshed, match_id))
+
+    @staticmethod
+    def _refreshed(match_id, task):
+        """Log failed refreshes."""
+        if not task.cancelled() and task.exception():
+            LOGGER.error("failed to index match %d: %r", match_id, task.exception())
+
+    @workload(BACKGROUND)
+    async def refresh(self, database):
+        """Index matches added since the last refresh."""
+        if not self._lock:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            start = time.time()
+            count = await self.load(database)
+            self.ready = True
+            LOGGER.info("indexed %d matches in %f", count, time.time() - start)
+
+    async def load(self, database):
+        """Add matches with an ID above those already indexed."""
+        matches, players = await self._fetch_shared(database)
+        for i, match in enumerate(matches):
+            self._add(match, players.get(match['id'], []))
+            if i % YIELD_EVERY == YIELD_EVERY - 1:
+                await asyncio.sleep(0)
+        return len(matches)
+
+    async def _fetch_shared(self, database):
+        """Get matches to add, from a batch fetched by another worker if it is recent enough.
+
+        A batch is used if it was fetched after this worker's last fetch and
+        starts at or below the matches already indexed. Initial loads are
+        not shared.
+        """
+        after = self._max_id
+        if not after or not CacheStore.enabled:
+            self._fetched = time.time()
+            return await self._fetch(database, after)
+        async with FileLock(CacheStore.lock_path(SHARED_NAMESPACE)):
+            batch = await CacheStore.get(SHARED_NAMESPACE, True, 'batch')
+            if batch and batch['fetched'] > self._fetched and batch['after'] <= after:
+                self._fetched = batch['fetched']
+                return [match for match in batch['matches'] if match['id'] > after], batch['players']
+            self._fetched = time.time()
+            matches, players = await self._fetch(database, after)
+            await CacheStore.set(SHARED_NAMESPACE, True, 'batch', dict(
+                fetched=self._fetched, after=after, matches=matches, players=players
+            ))
+            return matches, players
+
+    @staticmethod
+    async def _fetch(database, after):
+        """Get matches with an ID above `after`, in index order, and their player values, as dicts."""
+        match_query = """
+            select id, played, {}
+            from matches where id > :after
+            order by played nulls first, id
+        """.format(', '.join(MATCH_FIELDS))
+        player_query = """
+            select distinct match_id, {}
+            from players where match_id > :after
+        """.format(', '.join(PLAYER_FIELDS))
+        matches, players = await asyncio.gather(
+            database.fetch_all(match_query, values=dict(after=after)),
+            database.fetch_all(player_query, values=dict(after=after))
+        )
+        by_match = defaultdict(list)
+        for player in players:
+            by_match[player['match_id']].append(dict(player))
+        return [dict(match) for match in matches], dict(by_match)
+
+    def _add(self, match, players):
+        """Number and index a match."""
+        ordinal = len(self._ids)
+        self._ids.append(match['id'])
+        self._played.append(match['played'])
+        self._max_id = max(self._max_id, match['id'])
+        self._all.add(ordinal)
+        key = position(match['played'], match['id'])
+        if self._last is not None and key < self._last:
+            self._late.add(ordinal)
+            insort(self._late_positions, (key, ordinal))
+        else:
+            self._last = key
+        for field in MATCH_FIELDS:
+            if match[field] is not None:
+                self._bitmaps['matches.' + field][match[field]].add(ordinal)
+        for player in players:
+            for field in PLAYER_FIELDS:
+                if player[field] is not None:
+                    self._bitmaps['players.' + field][player[field]].add(ordinal)
+
+    def supports(self, params, order=None, fields=()):
+        """Check whether a search, and facets on `fields`, can be answered from the index."""
+        if not self.ready or order not in ORDERS:
+            return False
+        for field in fields:
+            table, _, column = field.partition('.')
+            if column not in {'matches': MATCH_FIELDS, 'players': PLAYER_FIELDS}.get(table, []):
+                return False
+        for table, criteria in params.items():
+            if table not in ('matches', 'players'):
+                if criteria:
+                    return False
+                continue
+            fields = MATCH_FIELDS if table == 'matches' else PLAYER_FIELDS
+            for field, criterion in criteria.items():
+                if field not in fields or set(criterion) != {'values'}:
+                    return False
+        return True
+
+    def matching(self, params):
+        """Get the ordinals of matches satisfying search criteria."""
+        bitmaps = []
+        for table in ('matches', 'players'):
+            for field, criterion in params.get(table, {}).items():
+                values = self._bitmaps.get('{}.{}'.format(table, field), {})
+                bitmap = Bitmap()
+                for value in criterion['values']:
+                    if value in values:
+                        bitmap |= values[value]
+                bitmaps.append(bitmap)
+        if not bitmaps:
+            return self._all
+        bitmaps.sort(key=len)
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            result &= bitmap
+        return result
+
+    def facets(self, bitmap, field):
+        """Get `(value, count)` of matches per value of a field, most frequent first."""
+        counts = []
+        for value, value_bitmap in self._bitmaps.get(field, {}).items():
+            count = len(bitmap & value_bitmap)
+            if count:
+                counts.append((value, count))
+        return sorted(counts, key=lambda count: count[1], reverse=True)
+
+    def page(self, bitmap, offset, limit, after=None):
+        """Get `(played, id)` of matches in search order.
+
+        With `after`, a `(played, id)` pair, the page starts after that
+        position instead. Matches numbered in order and out of order are
+        merged by position.
+        """
+        key = None if after is None else position(*after)
+        ordinals = heapq.merge(
+            self._in_order(bitmap, key), self._out_of_order(bitmap, key), key=self._position, reverse=True
+        )
+        page = itertools.islice(ordinals, offset, offset + limit)
+        return [(self._played[ordinal], self._ids[ordinal]) for ordinal in page]
+
+    def _position(self, ordinal):
+        """Sort key of a numbered match."""
+        return position(self._played[ordinal], self._ids[ordinal])
+
+    def _in_order(self, bitmap, key=None):
+        """Iterate matching ordinals numbered in order, downwards from before a position."""
+        for ordinal in bitmap.descending(None if key is None else self._bound(key)):
+            if ordinal not in self._late:
+                yield ordinal
+
+    def _out_of_order(self, bitmap, key=None):
+        """Iterate matching ordinals numbered out of order, downwards from before a position."""
+        end = len(self._late_positions) if key is None else bisect_left(self._late_positions, (key,))
+        for i in range(end - 1, -1, -1):
+            ordinal = self._late_positions[i][1]
+            if ordinal in bitmap:
+                yield ordinal
+
+    def _bound(self, key):
+        """Get the lowest ordinal numbered in order at or after a position.
+
+        Ordinals numbered out of order are skipped while bisecting.
+        """
+        low, high = 0, len(self._ids)
+        while low < high:
+            middle = (low + high) // 2
+            probe = middle
+            while probe >= low and probe in self._late:
+                probe -= 1
+            if probe < low or self._position(probe) < key:
+                low = middle + 1
+            else:
+                high = probe
+        return low
+
+    def status(self):
+        """Get index size."""
+        return dict(
+            enabled=self.enabled,
+            ready=self.ready,
+            matches=len(self._ids),
+            late=len(self._late),
+            values={field: len(values) for field, values in self._bitmaps.items()}
+        )
+
+
+SearchIndex = MatchIndex() # pylint: disable=invalid-name
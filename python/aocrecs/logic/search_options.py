@@ -1,6 +1,7 @@
 """Search options."""
 import asyncio
 from aocrecs.cache import cached
+from aocrecs.consts import MATCH_ADDED
 
 
 def bool_option():
@@ -21,14 +22,19 @@ def diplo_options():
     ]
 
 
-@cached(warm=True, ttl=None)
+def same_dataset(payload, arguments):
+    """Check whether a new match is in the dataset of a cached entry."""
+    return arguments.get('dataset_id') == payload['dataset_id']
+
+
+@cached(warm=[[0], [1], [100]], ttl=None)
 async def civilizations(database, dataset_id):
     """Get civilizations for a dataset."""
     query = "select id as value, name as label from civilizations where dataset_id=:dataset_id"
     return list(map(dict, await database.fetch_all(query, values={'dataset_id': dataset_id})))
 
 
-@cached(warm=[0, 1, 7, 100, 200], ttl=None)
+@cached(warm=[0, 1, 7, 100, 200], ttl=None, invalidate_on={MATCH_ADDED: same_dataset})
 async def versions(database, dataset_id):
     """Get versions of a dataset."""
     query = """
@@ -39,7 +45,7 @@ async def versions(database, dataset_id):
     return list(map(dict, await database.fetch_all(query, values={'dataset_id': dataset_id})))
 
 
-@cached(warm=True, ttl=None)
+@cached(warm=[['voobly'], ['de']], ttl=None)
 async def ladders(database, platform_id):
     """Get ladders for a platform."""
     query = "select id as value, name as label from ladders where platform_id=:platform_id"
@@ -2,16 +2,18 @@
 import asyncio
 import datetime
 
-from aocrecs.consts import COLLECTION_STARTED
+from aocrecs.consts import COLLECTION_STARTED, MATCH_ADDED
 from aocrecs.cache import cached
+from aocrecs.database import workload, ANALYTICS
 
 
-@cached(warm=True, ttl=2)
+@cached(warm=True, ttl=2, invalidate_on=[MATCH_ADDED])
 async def live_match_count(database):
-    return await database.fetch_one('select count(*) as count from matches')
+    return dict(await database.fetch_one('select count(*) as count from matches'))
 
 
-@cached(warm=True, ttl=3600)
+@cached(warm=True, ttl=3600, invalidate_on=[MATCH_ADDED])
+@workload(ANALYTICS)
 async def summary(database):
     """Get summary statistics."""
     match_count, series_count, player_count = await asyncio.gather(
@@ -26,7 +28,8 @@ async def summary(database):
     }
 
 
-@cached(warm=True, ttl=3600)
+@cached(warm=True, ttl=3600, invalidate_on=[MATCH_ADDED])
+@workload(ANALYTICS)
 async def map_count(database):
     """Get map count."""
     query = "select count(*) as count from (select map_name from matches group by map_name) as x"
@@ -34,7 +37,11 @@ async def map_count(database):
     return result['count']
 
 
-@cached(warm=[['game_types', 'type_id'], ['datasets', 'dataset_id'], ['platforms', 'platform_id']], ttl=86400)
+@cached(
+    warm=[['game_types', 'type_id'], ['datasets', 'dataset_id'], ['platforms', 'platform_id']],
+    ttl=86400, invalidate_on=[MATCH_ADDED]
+)
+@workload(ANALYTICS)
 async def rel_agg_query(database, table, foreign_key):
     """Aggregate across related table."""
     query = """
@@ -46,7 +53,8 @@ async def rel_agg_query(database, table, foreign_key):
     return [dict(r) for r in await database.fetch_all(query)]
 
 
-@cached(warm=[['files', 'language'], ['matches', 'diplomacy_type']], ttl=86400)
+@cached(warm=[['files', 'language'], ['matches', 'diplomacy_type']], ttl=86400, invalidate_on=[MATCH_ADDED])
+@workload(ANALYTICS)
 async def agg_query(database, table, field):
     """Aggregate on table."""
     query = """
@@ -55,7 +63,8 @@ async def agg_query(database, table, field):
     return [dict(r) for r in await database.fetch_all(query)]
 
 
-@cached(warm=True, ttl=86400)
+@cached(warm=True, ttl=86400, invalidate_on=[MATCH_ADDED])
+@workload(ANALYTICS)
 async def by_day(database):
     """Get daily match counts."""
     query = """
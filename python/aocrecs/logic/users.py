@@ -2,9 +2,11 @@
 import asyncio
 
 from aocrecs.cache import cached
+from aocrecs.database import workload, ANALYTICS
 
 
-@cached(warm=True, ttl=86400)
+@cached(warm=True, ttl=86400, stale_ttl=86400)
+@workload(ANALYTICS)
 async def get_people(database):
     """Get all people."""
     query = """
@@ -1,9 +1,6 @@
 """aocrecs.com Application."""
 import coloredlogs
-import databases
 
-from ariadne.asgi import GraphQL
-from ariadne.contrib.tracing.apollotracing import ApolloTracingExtension
 from starlette.applications import Starlette
 from starlette.config import Config
 from starlette.datastructures import Secret, URL
@@ -13,27 +10,68 @@ from starlette.middleware.cors import CORSMiddleware
 from starlette.routing import Route, WebSocketRoute
 
 from aocrecs import resolvers, routes as aoc_routes
+from aocrecs.api import GraphQL
 from aocrecs.context import Context
-from aocrecs.cache import CacheWarmer
+from aocrecs.database import InstrumentedDatabase, SQLStatistics, DEFAULT_SLOW_SECONDS, DEFAULT_POOLS, parse_pools
+from aocrecs.cost import QueryCostExtension, DEFAULT_BUDGET
+from aocrecs.cache import CacheWarmer, CacheStore, BoundedMemoryCache
+from aocrecs.logic.match_flags import MatchFlags, DEFAULT_FLAGS_REFRESH_SECONDS
+from aocrecs.logic.search_index import SearchIndex, DEFAULT_REFRESH_SECONDS
+from aocrecs.tracing import sampled, DEFAULT_SAMPLE_RATE, DEFAULT_HEADER
 
 
 config = Config('./.env') # pylint: disable=invalid-name
 DATABASE_URL = config('DATABASE_URL', cast=URL)
+DATABASE_POOLS = config('DATABASE_POOLS', cast=parse_pools, default=DEFAULT_POOLS)
 VOOBLY_USERNAME = config('VOOBLY_USERNAME')
 VOOBLY_PASSWORD = config('VOOBLY_PASSWORD', cast=Secret)
 DEBUG = config('DEBUG', cast=bool, default=False)
+ADMIN_TOKEN = config('ADMIN_TOKEN', cast=Secret, default='')
+CACHE_MAX_ENTRIES = config('CACHE_MAX_ENTRIES', cast=int, default=None)
+CACHE_MAX_BYTES = config('CACHE_MAX_BYTES', cast=int, default=None)
+CACHE_PATH = config('CACHE_PATH', default=None)
+WARM_CONCURRENCY = config('WARM_CONCURRENCY', cast=int, default=None)
+WARM_JITTER = config('WARM_JITTER', cast=float, default=None)
+WARM_TIMEOUT = config('WARM_TIMEOUT', cast=float, default=None)
+WARM_SNAPSHOT = config('WARM_SNAPSHOT', default=None)
+BATCH_WINDOW = config('BATCH_WINDOW', cast=float, default=0)
+PERSISTED_QUERIES = config('PERSISTED_QUERIES', default=None)
+TRACE_SAMPLE_RATE = config('TRACE_SAMPLE_RATE', cast=float, default=DEFAULT_SAMPLE_RATE)
+TRACE_HEADER = config('TRACE_HEADER', default=DEFAULT_HEADER)
+SQL_INSTRUMENT = config('SQL_INSTRUMENT', cast=bool, default=True)
+SQL_SLOW_SECONDS = config('SQL_SLOW_SECONDS', cast=float, default=DEFAULT_SLOW_SECONDS)
+SQL_EXPLAIN_RATE = config('SQL_EXPLAIN_RATE', cast=float, default=0)
+QUERY_COST_BUDGET = config('QUERY_COST_BUDGET', cast=int, default=DEFAULT_BUDGET)
+MATCH_FLAGS = config('MATCH_FLAGS', cast=bool, default=False)
+MATCH_FLAGS_REFRESH = config('MATCH_FLAGS_REFRESH', cast=int, default=DEFAULT_FLAGS_REFRESH_SECONDS)
+SEARCH_INDEX = config('SEARCH_INDEX', cast=bool, default=False)
+SEARCH_INDEX_REFRESH = config('SEARCH_INDEX_REFRESH', cast=int, default=DEFAULT_REFRESH_SECONDS)
 
 
 def new_app():
     """Create a new app instance."""
     coloredlogs.install(level='DEBUG' if DEBUG else 'INFO', fmt='%(asctime)s %(name)s %(levelname)s %(message)s')
-    database = databases.Database(DATABASE_URL)
-    warmer = CacheWarmer(database, disable=DEBUG)
+    BoundedMemoryCache.configure(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES)
+    SQLStatistics.configure(enabled=SQL_INSTRUMENT, slow_seconds=SQL_SLOW_SECONDS, explain_rate=SQL_EXPLAIN_RATE)
+    database = InstrumentedDatabase(DATABASE_URL, DATABASE_POOLS)
+    warmer = CacheWarmer(
+        database, disable=DEBUG, concurrency=WARM_CONCURRENCY, jitter=WARM_JITTER, timeout=WARM_TIMEOUT,
+        snapshot=WARM_SNAPSHOT
+    )
+    store = CacheStore(CACHE_PATH)
+    MatchFlags.configure(enabled=MATCH_FLAGS, database=database)
+    SearchIndex.configure(enabled=SEARCH_INDEX, database=database)
+    if MATCH_FLAGS:
+        CacheWarmer.register(MatchFlags.refresh, MATCH_FLAGS_REFRESH, None, local=True, exclusive=True)
+    if SEARCH_INDEX:
+        CacheWarmer.register(SearchIndex.refresh, SEARCH_INDEX_REFRESH, None, local=True)
     graphql = GraphQL(
         resolvers.SCHEMA,
         debug=DEBUG,
-        context_value=lambda request: Context(request, database),
-        extensions=[ApolloTracingExtension]
+        context_value=lambda request: Context(request, database, batch_window=BATCH_WINDOW),
+        extensions=sampled([QueryCostExtension], rate=TRACE_SAMPLE_RATE, header=TRACE_HEADER),
+        cost_budget=QUERY_COST_BUDGET,
+        persisted_queries=PERSISTED_QUERIES
     )
     routes = [
         Route('/api', graphql, name='api', methods=['GET', 'POST']),
@@ -41,6 +79,9 @@ def new_app():
         Route('/api/download/{file_id:int}', aoc_routes.download, name='download'),
         Route('/api/map/{match_id:int}', aoc_routes.svg_map, name='minimap'),
         Route('/api/portrait/{person_id:int}', aoc_routes.portrait, name='portrait'),
+        Route('/api/metrics', aoc_routes.metrics, name='metrics'),
+        Route('/api/metrics/sql', aoc_routes.sql_instrumentation, name='sql', methods=['GET', 'POST']),
+        Route('/api/metrics/sql/plans', aoc_routes.sql_plans, name='sql_plans'),
         Route('/nightbot/match/{steam_id:int}', aoc_routes.nightbot, name='nightbot')
     ]
 
@@ -53,11 +94,12 @@ def new_app():
         debug=DEBUG,
         routes=routes,
         middleware=middleware,
-        on_startup=[warmer.setup],
-        on_shutdown=[warmer.teardown]
+        on_startup=[graphql.setup, store.setup, warmer.setup, MatchFlags.setup, SearchIndex.setup],
+        on_shutdown=[SearchIndex.teardown, warmer.teardown, store.teardown]
     )
     app.state.database = database
     app.state.database_url = DATABASE_URL
+    app.state.admin_token = str(ADMIN_TOKEN)
     app.state.voobly_username = VOOBLY_USERNAME
     app.state.voobly_password = VOOBLY_PASSWORD
     return app
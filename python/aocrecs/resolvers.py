@@ -5,10 +5,11 @@ from ariadne import QueryType, ObjectType, make_executable_schema, ScalarType, u
 from aocrecs.logic import (
     search, metaladder, report, search_options, events,
     matches, stats as stat, maps, civilizations, users, odds,
-    playback, market
+    playback, market, match_flags
 )
 from aocrecs.schema import TYPE_DEFS
-from aocrecs.upload import add_rec
+from aocrecs.upload import add_rec, publish_match_added
+from aocrecs.util import selected_fields
 
 # Unhelpful rules for resolver boilerplate.
 # pylint: disable=unused-argument, missing-function-docstring, invalid-name, redefined-builtin
@@ -38,6 +39,21 @@ file_ = ObjectType('File')
 hits = ObjectType('Hits')
 event = ObjectType('Event')
 tournament = ObjectType('Tournament')
+
+# Player fields backed by loaders keyed on (match_id, number).
+PLAYER_LOADERS = {
+    'timeseries': playback.get_timeseries,
+    'units_trained': playback.get_units_trained,
+    'research': matches.get_research_by_player,
+    'apm': playback.get_apm,
+    'trade_carts': playback.get_trade_carts,
+    'villagers': playback.get_villagers,
+    'map_control': playback.get_map_control,
+    'flags': match_flags.get_player_flags,
+    'metrics': playback.get_metrics,
+    'villager_allocation': playback.get_villager_allocation,
+    'transactions': market.get_transactions
+}
 series = ObjectType('Series')
 side = ObjectType('Side')
 meta_ladder = ObjectType('Ladder')
@@ -86,8 +102,8 @@ async def resolve_latest(obj, info):
 
 
 @latest.field('matches')
-async def resolve_latest_matches(obj, info, dataset_id, order, offset, limit):
-    return await search.latest(info.context, dataset_id, order, offset, limit)
+async def resolve_latest_matches(obj, info, dataset_id, order, offset, limit, cursor=None):
+    return await search.latest(info.context, dataset_id, order, offset, limit, cursor)
 
 
 @query.field('reports')
@@ -172,9 +188,9 @@ async def resolve_top_dataset(obj, info):
 
 
 @user.field('matches')
-async def resolve_user_matches(obj, info, order, offset, limit):
+async def resolve_user_matches(obj, info, order, offset, limit, cursor=None):
     params = {'players': {'user_id': {'values': [obj['id']]}}}
-    return await search.get_hits(info.context, params, order, offset, limit)
+    return await search.get_hits(info.context, params, order, offset, limit, cursor)
 
 
 @user.field('meta_ranks')
@@ -217,9 +233,9 @@ async def resolve_ranks(obj, info, limit):
 
 
 @series.field('matches')
-async def resolve_series_matches(obj, info, order, offset, limit):
+async def resolve_series_matches(obj, info, order, offset, limit, cursor=None):
     params = {'matches': {'id': {'values': obj['match_ids']}}}
-    return await search.get_hits(info.context, params, order, offset, limit)
+    return await search.get_hits(info.context, params, order, offset, limit, cursor)
 
 
 @series.field('sides')
@@ -248,20 +264,20 @@ async def resolve_search(obj, info):
 
 
 @search_result.field('matches')
-async def resolve_search_matches(obj, info, params, order, offset, limit):
-    return await search.get_hits(info.context, params, order, offset, limit)
+async def resolve_search_matches(obj, info, params, order, offset, limit, cursor=None):
+    return await search.get_hits(info.context, params, order, offset, limit, cursor)
 
 
 @civilization.field('matches')
-async def resolve_civilization_matches(obj, info, order, offset, limit):
+async def resolve_civilization_matches(obj, info, order, offset, limit, cursor=None):
     params = {'players': {'civilization_id': {'values': [obj['id']]}, 'dataset_id': {'values': [obj['dataset_id']]}}}
-    return await search.get_hits(info.context, params, order, offset, limit)
+    return await search.get_hits(info.context, params, order, offset, limit, cursor)
 
 
 @map_.field('matches')
-async def resolve_map_matches(obj, info, offset, order, limit):
+async def resolve_map_matches(obj, info, offset, order, limit, cursor=None):
     params = {'matches': {'map_name': {'values': [obj['name']]}}}
-    return await search.get_hits(info.context, params, order, offset, limit)
+    return await search.get_hits(info.context, params, order, offset, limit, cursor)
 
 
 @map_.field('top_civilizations')
@@ -281,7 +297,22 @@ async def resolve_match_map_events(obj, info):
 
 @query.field('match')
 async def resolve_match(obj, info, id):
-    return await info.context.load(matches.get_match, id)
+    match_ = await info.context.load(matches.get_match, id)
+    if match_:
+        prefetch_players(info, match_)
+    return match_
+
+
+def prefetch_players(info, match_):
+    """Start loaders for every selected player field at once.
+
+    Child resolvers then await the already dispatched batches.
+    """
+    keys = [(match_['id'], p['number']) for p in match_['players']]
+    for field in selected_fields(info, 'players') & PLAYER_LOADERS.keys():
+        info.context.load_many(PLAYER_LOADERS[field], keys).add_done_callback(
+            lambda future: future.cancelled() or future.exception()
+        )
 
 
 @match.field('odds')
@@ -356,7 +387,7 @@ async def resolve_map_control(obj, info):
 
 @player.field('flags')
 async def resolve_flags(obj, info):
-    return await info.context.load(playback.get_flags, (obj['match_id'], obj['number']))
+    return await info.context.load(match_flags.get_player_flags, (obj['match_id'], obj['number']))
 
 
 @player.field('metrics')
@@ -374,6 +405,21 @@ async def resolve_transactions(obj, info):
     return await info.context.load(market.get_transactions, (obj['match_id'], obj['number']))
 
 
+@hits.field('count')
+async def resolve_hits_count(obj, info):
+    return (await info.context.load(search.get_counts, search.counts_key(obj['params'])))['count']
+
+
+@hits.field('facets')
+async def resolve_hits_facets(obj, info, fields):
+    return (await info.context.load(search.get_counts, search.counts_key(obj['params'], fields)))['facets']
+
+
+@hits.field('capped_count')
+async def resolve_hits_capped_count(obj, info, cap):
+    return await search.get_count(info.context.database, obj['params'], cap)
+
+
 @query.field('map')
 async def resolve_map(obj, info, name):
     return dict(name=name)
@@ -435,21 +481,24 @@ async def resolve_by_day(obj, info):
 
 
 @person.field('matches')
-async def resolve_person_matches(obj, info, order, offset, limit):
+async def resolve_person_matches(obj, info, order, offset, limit, cursor=None):
     params = {'players': {'user_id': {'values': [a['id'] for a in obj['accounts']]}}}
-    return await search.get_hits(info.context, params, order, offset, limit)
+    return await search.get_hits(info.context, params, order, offset, limit, cursor)
 
 
 @mutation.field('upload')
 async def resolve_upload(obj, info, rec_file):
     data = await rec_file.read()
-    return await add_rec(
+    result = await add_rec(
         rec_file.filename,
         data,
         str(info.context.request.app.state.database_url),
         info.context.request.app.state.voobly_username,
         str(info.context.request.app.state.voobly_password)
     )
+    if result['success'] and isinstance(result['match_id'], int):
+        await publish_match_added(info.context.database, result['match_id'])
+    return result
 
 
 SCHEMA = make_executable_schema(TYPE_DEFS, [
@@ -1,11 +1,16 @@
 """Routes."""
 import asyncio
 import requests
-from starlette.responses import Response, PlainTextResponse
+from starlette.responses import Response, PlainTextResponse, JSONResponse
 from mgz.util import Version
 from mgzdb.compress import decompress_tiles, decompress_objects
+from aocrecs.cache import CacheStatistics, CacheWarmer
+from aocrecs.database import SQLStatistics
 from aocrecs.download import get_rec
+from aocrecs.logic.search_index import SearchIndex
 from aocrecs.logic.minimap import generate_svg
+from aocrecs.tracing import ResolverLatency
+from aocrecs.util import prometheus_text
 
 async def nightbot(request):
     """Nightbot match prototype."""
@@ -53,6 +58,69 @@ async def portrait(request):
     return Response(result['portrait'], media_type='image/jpeg')
 
 
+async def metrics(request):
+    """Runtime metrics as JSON or, with `?format=prometheus`, Prometheus text."""
+    cache = CacheStatistics.collect()
+    warmer = CacheWarmer.status()
+    resolvers = ResolverLatency.collect()
+    sql = SQLStatistics.collect()
+    pools = request.app.state.database.status()
+    if request.query_params.get('format') == 'prometheus':
+        return PlainTextResponse(
+            prometheus_text('aocrecs_cache', 'namespace', cache) +
+            prometheus_text('aocrecs_cache_stale', 'key', {
+                key: dict(served=count) for key, count in CacheStatistics.stale_keys().items()
+            }) +
+            prometheus_text('aocrecs_warmer', 'job', warmer) +
+            prometheus_text('aocrecs_resolver', 'field', resolvers) +
+            prometheus_text('aocrecs_sql', 'fingerprint', sql) +
+            prometheus_text('aocrecs_pool', 'pool', pools)
+        )
+    return JSONResponse(dict(
+        cache=cache, warmer=warmer, resolvers=resolvers, sql=sql, pools=pools, search_index=SearchIndex.status()
+    ))
+
+
+def authorized(request):
+    """Check the admin token."""
+    token = request.app.state.admin_token
+    return bool(token) and request.headers.get('Authorization') == 'Bearer {}'.format(token)
+
+
+async def sql_instrumentation(request):
+    """Show or, with a POST, change SQL instrumentation settings.
+
+    Accepts `enabled` (0 or 1), `slow_seconds`, `explain_rate` and `reset`
+    query parameters.
+    """
+    if request.method == 'POST':
+        if not authorized(request):
+            return PlainTextResponse('Forbidden', status_code=403)
+        params = request.query_params
+        try:
+            SQLStatistics.configure(
+                enabled=bool(int(params['enabled'])) if 'enabled' in params else None,
+                slow_seconds=float(params['slow_seconds']) if 'slow_seconds' in params else None,
+                explain_rate=float(params['explain_rate']) if 'explain_rate' in params else None
+            )
+        except ValueError:
+            return PlainTextResponse('Invalid parameter', status_code=400)
+        if params.get('reset'):
+            SQLStatistics.reset()
+    return JSONResponse(SQLStatistics.status())
+
+
+async def sql_plans(request):
+    """List the slowest captured statement plans."""
+    if not authorized(request):
+        return PlainTextResponse('Forbidden', status_code=403)
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return PlainTextResponse('Invalid parameter', status_code=400)
+    return JSONResponse(SQLStatistics.worst_plans(limit), headers={'Cache-Control': 'no-store'})
+
+
 async def svg_map(request):
     """Get map tile SVGs."""
     match_id = request.path_params['match_id']
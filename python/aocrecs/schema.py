@@ -37,7 +37,7 @@ type LiveStats {
 }
 
 type Latest {
-    matches(dataset_id: Int!, order: [String], offset: Int = 0, limit: Int = 10): Hits
+    matches(dataset_id: Int!, order: [String], offset: Int = 0, limit: Int = 10, cursor: String): Hits
 }
 
 type LatestSummary {
@@ -47,7 +47,7 @@ type LatestSummary {
 }
 
 type SearchResult {
-    matches(params: Dict!, order: [String], offset: Int = 0, limit: Int = 10): Hits
+    matches(params: Dict!, order: [String], offset: Int = 0, limit: Int = 10, cursor: String): Hits
 }
 
 type StatImprovement {
@@ -111,7 +111,25 @@ type Rank {
 
 type Hits {
     count: Int!
+    capped_count(cap: Int = 10000): CappedCount!
+    facets(fields: [String!]!): [Facet!]!
     hits: [Match]
+    next_cursor: String
+}
+
+type CappedCount {
+    count: Int!
+    capped: Boolean!
+}
+
+type Facet {
+    field: String!
+    values: [FacetValue!]!
+}
+
+type FacetValue {
+    value: String!
+    count: Int!
 }
 
 type Stats {
@@ -175,7 +193,7 @@ type Map {
     percent: Float!
     events: [Event]
     preview_url: String
-    matches(order: [String], offset: Int = 0, limit: Int = 10): Hits
+    matches(order: [String], offset: Int = 0, limit: Int = 10, cursor: String): Hits
     top_civilizations(limit: Int = 3): [Civilization]
 }
 
@@ -186,7 +204,7 @@ type Civilization {
     count: Int!
     percent: Float!
     bonuses: [CivilizationBonus]
-    matches(order: [String], offset: Int = 0, limit: Int = 10): Hits
+    matches(order: [String], offset: Int = 0, limit: Int = 10, cursor: String): Hits
 }
 
 type CivilizationBonus {
@@ -555,7 +573,7 @@ type Series {
     tournament: Tournament
     participants: [Participant]
     match_ids: [Int!]
-    matches(order: [String], offset: Int = 0, limit: Int = 10): Hits
+    matches(order: [String], offset: Int = 0, limit: Int = 10, cursor: String): Hits
 }
 
 type Side {
@@ -580,7 +598,7 @@ type User {
     name: String!
     person: Person
     meta_ranks(ladder_ids: [Int]): [Rank]
-    matches(order: [String], offset: Int = 0, limit: Int = 10): Hits
+    matches(order: [String], offset: Int = 0, limit: Int = 10, cursor: String): Hits
     top_map: Map
     top_civilization: Civilization
     top_dataset: Dataset
@@ -612,7 +630,7 @@ type Person {
     aliases: [String]
     accounts: [User]
     events: [Event]
-    matches(order: [String], offset: Int = 0, limit: Int = 10): Hits
+    matches(order: [String], offset: Int = 0, limit: Int = 10, cursor: String): Hits
 }
 
 type Mutation {
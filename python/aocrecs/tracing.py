@@ -0,0 +1,90 @@
+"""Sampled resolver tracing."""
+from bisect import bisect_left
+from collections import defaultdict
+from inspect import isawaitable
+import random
+import time
+
+from ariadne.contrib.tracing.utils import should_trace
+from ariadne.types import Extension
+
+
+# Histogram bucket upper bounds in seconds.
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf')]
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_HEADER = 'X-Trace'
+
+
+class Histograms:
+    """Resolver latency histograms keyed by `Type.field`."""
+
+    def __init__(self):
+        """Initialize."""
+        self._counts = defaultdict(lambda: [0] * len(BUCKETS))
+        self._totals = defaultdict(float)
+
+    def observe(self, field, seconds):
+        """Record a resolver duration."""
+        self._counts[field][bisect_left(BUCKETS, seconds)] += 1
+        self._totals[field] += seconds
+
+    def collect(self):
+        """Get counts, averages and bucket-bound percentiles per field."""
+        output = {}
+        for field, counts in self._counts.items():
+            total = sum(counts)
+            output[field] = dict(
+                count=total,
+                total_seconds=self._totals[field],
+                avg_seconds=self._totals[field] / total,
+                p50_seconds=self._percentile(counts, total, 0.5),
+                p95_seconds=self._percentile(counts, total, 0.95),
+                p99_seconds=self._percentile(counts, total, 0.99),
+                buckets={str(bound): count for bound, count in zip(BUCKETS, counts)}
+            )
+        return output
+
+    @staticmethod
+    def _percentile(counts, total, fraction):
+        """Upper bound of the bucket containing a percentile."""
+        seen = 0
+        for bound, count in zip(BUCKETS, counts):
+            seen += count
+            if seen >= total * fraction:
+                return bound if bound != float('inf') else None
+        return None
+
+
+class TracingExtension(Extension):
+    """Record resolver durations into the shared histograms."""
+
+    async def resolve(self, next_, parent, info, **kwargs):
+        """Time a resolver."""
+        if not should_trace(info):
+            result = next_(parent, info, **kwargs)
+            if isawaitable(result):
+                result = await result
+            return result
+        start = time.perf_counter()
+        try:
+            result = next_(parent, info, **kwargs)
+            if isawaitable(result):
+                result = await result
+            return result
+        finally:
+            ResolverLatency.observe('{}.{}'.format(info.parent_type.name, info.field_name), time.perf_counter() - start)
+
+
+def sampled(extensions, rate=DEFAULT_SAMPLE_RATE, header=DEFAULT_HEADER):
+    """Build a per-request extensions callable.
+
+    A fraction `rate` of requests, and requests sending `header`, are traced.
+    """
+    def get_extensions(request, _context):
+        if request.headers.get(header) or random.random() < rate:
+            return [TracingExtension] + extensions
+        return extensions
+    return get_extensions
+
+
+ResolverLatency = Histograms() # pylint: disable=invalid-name
@@ -1,5 +1,6 @@
 """Provide rec file uploads."""
 
+import asyncio
 import os
 import tempfile
 
@@ -10,7 +11,10 @@ from mgzdb import platforms
 from mgzdb.api import API
 from mgzdb.util import path_components
 
-from aocrecs.consts import S3_BUCKET, S3_BUCKET_ERRORS
+from aocrecs.cache import CacheBus
+from aocrecs.consts import S3_BUCKET, S3_BUCKET_ERRORS, MATCH_ADDED
+from aocrecs.logic.match_flags import MatchFlags
+from aocrecs.logic.search_index import SearchIndex
 
 
 @aiowrap
@@ -33,3 +37,36 @@ def add_rec(filename, contents, database_url, voobly_username, voobly_password):
                 with open(os.path.join(store_path, object_path), 'rb') as data:
                     s3_client.upload_fileobj(data, S3_BUCKET, object_path)
             return dict(success=True, match_id=payload)
+
+
+async def publish_match_added(database, match_id):
+    """Notify caches that a match was added.
+
+    Flags are materialized first, so that searches recomputed after
+    invalidation find the new match. Indexing it for search runs in the
+    background.
+    """
+    match_query = """
+        select id, dataset_id, platform_id, map_name
+        from matches where id=:match_id
+    """
+    player_query = """
+        select number, user_id, civilization_id
+        from players where match_id=:match_id
+    """
+    match = await database.fetch_one(match_query, values={'match_id': match_id})
+    if not match:
+        return
+    players = await database.fetch_all(player_query, values={'match_id': match_id})
+    await asyncio.gather(
+        MatchFlags.on_match_added(database, match['id']),
+        SearchIndex.on_match_added(database, match['id'])
+    )
+    await CacheBus.publish(
+        MATCH_ADDED,
+        match_id=match['id'],
+        dataset_id=match['dataset_id'],
+        platform_id=match['platform_id'],
+        map_name=match['map_name'],
+        players=list(map(dict, players))
+    )
@@ -32,3 +32,78 @@ def compound_where(keys, fields):
             args[bind_name] = value
         ors.append(ands)
     return ' or '.join([' and '.join(a) for a in ors]), args
+
+
+def compound_in(keys, fields, types=None, prefix=''):
+    """Create a filter on compound keys using parallel arrays.
+
+    The statement text and number of binds do not depend on the number of
+    keys, and the keys are joined as a set rather than matched one by one.
+    """
+    types = types or ['integer'] * len(fields)
+    args = {}
+    arrays = []
+    for i, (field, type_) in enumerate(zip(fields, types)):
+        bind_name = '{}{}_keys'.format(prefix, field.replace('.', '_'))
+        arrays.append('cast(:{} as {}[])'.format(bind_name, type_))
+        args[bind_name] = [key[i] for key in keys]
+    return '({}) in (select * from unnest({}))'.format(', '.join(fields), ', '.join(arrays)), args
+
+
+def namespace_binds(prefix, query, values):
+    """Prefix bind names so that several queries can share one statement."""
+    new_values = {}
+    for key, value in values.items():
+        query = query.replace(':{}'.format(key), ':{}_{}'.format(prefix, key))
+        new_values['{}_{}'.format(prefix, key)] = value
+    return query, new_values
+
+
+def prometheus_label(value):
+    """Escape a label value for Prometheus text exposition."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(prefix, label, data):
+    """Render `{label value: {metric: value}}` as Prometheus text exposition."""
+    lines = []
+    metrics = sorted({metric for values in data.values() for metric in values})
+    for metric in metrics:
+        name = '{}_{}'.format(prefix, metric)
+        samples = []
+        for label_value, values in sorted(data.items()):
+            value = values.get(metric)
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            samples.append('{}{{{}="{}"}} {}'.format(name, label, prometheus_label(label_value), value))
+        if samples:
+            lines.append('# TYPE {} gauge'.format(name))
+            lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def selected_fields(info, name):
+    """Names of fields selected below any `name` field in the current selection.
+
+    Follows fragment spreads and inline fragments.
+    """
+    fields = set()
+
+    def walk(selection_set, inside):
+        if not selection_set:
+            return
+        for selection in selection_set.selections:
+            if selection.kind == 'fragment_spread':
+                walk(info.fragments[selection.name.value].selection_set, inside)
+            elif selection.kind == 'inline_fragment':
+                walk(selection.selection_set, inside)
+            else:
+                if inside:
+                    fields.add(selection.name.value)
+                walk(selection.selection_set, inside or selection.name.value == name)
+
+    for node in info.field_nodes:
+        walk(node.selection_set, False)
+    return fields
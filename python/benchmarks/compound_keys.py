@@ -0,0 +1,59 @@
+"""Compare OR-chain and unnest filters on compound keys.
+
+Usage: python benchmarks/compound_keys.py DATABASE_URL [SIZES] [REPEAT]
+
+Reports median planning time, execution time and client latency per
+batch size for both filters on a timeseries lookup.
+"""
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import databases
+
+from aocrecs.util import compound_in, compound_where
+
+
+QUERY = 'select match_id, player_number, count(*) from timeseries where {} group by match_id, player_number'
+KEYS_QUERY = 'select match_id, number from players order by random() limit :limit'
+
+
+async def measure(database, where, values, repeat):
+    """Median planning, execution and client times in milliseconds."""
+    planning, execution, latency = [], [], []
+    for _ in range(repeat):
+        plan = await database.fetch_val(
+            'explain (analyze, format json) ' + QUERY.format(where), values=values, column='QUERY PLAN'
+        )
+        plan = json.loads(plan)[0] if isinstance(plan, str) else plan[0]
+        planning.append(plan['Planning Time'])
+        execution.append(plan['Execution Time'])
+        start = time.perf_counter()
+        await database.fetch_all(QUERY.format(where), values=values)
+        latency.append((time.perf_counter() - start) * 1000)
+    return statistics.median(planning), statistics.median(execution), statistics.median(latency)
+
+
+async def main(url, sizes, repeat):
+    """Run the benchmark."""
+    database = databases.Database(url)
+    await database.connect()
+    print('{:>6} {:>8} {:>12} {:>12} {:>12}'.format('keys', 'filter', 'plan ms', 'exec ms', 'latency ms'))
+    for size in sizes:
+        keys = [(row['match_id'], row['number']) for row in await database.fetch_all(KEYS_QUERY, values={'limit': size})]
+        for name, builder in [('or', compound_where), ('unnest', compound_in)]:
+            where, values = builder(keys, ('match_id', 'player_number'))
+            print('{:>6} {:>8} {:>12.2f} {:>12.2f} {:>12.2f}'.format(
+                len(keys), name, *await measure(database, where, values, repeat)
+            ))
+    await database.disconnect()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main(
+        sys.argv[1],
+        [int(size) for size in (sys.argv[2] if len(sys.argv) > 2 else '1,8,64,512').split(',')],
+        int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    ))
@@ -0,0 +1,34 @@
+"""Compressed bitmaps."""
+import random
+
+from aocrecs.bitmap import Bitmap, ARRAY_MAX
+
+
+def bitmap(values):
+    """Make a bitmap of values."""
+    result = Bitmap()
+    for value in values:
+        result.add(value)
+    return result
+
+
+def test_set_operations():
+    """Bitmaps behave like sets across sparse and dense containers."""
+    rng = random.Random(1)
+    sparse = {rng.randrange(1 << 20) for _ in range(1000)}
+    dense = set(range(65536, 65536 + 3 * ARRAY_MAX, 2)) | {rng.randrange(1 << 20) for _ in range(1000)}
+    left, right = bitmap(sparse), bitmap(dense)
+    assert isinstance(right.containers[1], int)
+    assert len(left) == len(sparse) and len(right) == len(dense)
+    assert all(value in left for value in sparse)
+    assert 1 << 21 not in left
+    assert list((left & right).descending()) == sorted(sparse & dense, reverse=True)
+    assert list((left | right).descending()) == sorted(sparse | dense, reverse=True)
+    assert len(left) == len(sparse)
+
+
+def test_descending_below():
+    """Values below a bound are iterated from largest to smallest."""
+    values = {0, 5, 65535, 65536, 70000, 1 << 20}
+    assert list(bitmap(values).descending(70000)) == [65536, 65535, 5, 0]
+    assert not list(bitmap(values).descending(0))
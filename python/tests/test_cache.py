@@ -0,0 +1,155 @@
+"""Cache decorators."""
+import asyncio
+import time
+
+from aocrecs.cache import cached, source_version, Warmer, CacheBus, CacheStatistics, CacheStore
+
+
+def test_single_flight():
+    """Concurrent misses on a key share one computation."""
+    calls = []
+
+    @cached(ttl=60)
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def run():
+        return await asyncio.gather(*[compute(1) for _ in range(5)], compute(2))
+
+    assert asyncio.run(run()) == [2, 2, 2, 2, 2, 4]
+    assert sorted(calls) == [1, 2]
+
+
+def test_stale_while_revalidate():
+    """Expired values are served while one background task refreshes them."""
+    calls = []
+
+    @cached(ttl=60, stale_ttl=60)
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def run():
+        first = await compute(1)
+        key = compute.cached.get_cache_key(compute, (1,), {})
+        stale = await compute.cached.cache.get(key)
+        await compute.cached.cache.set(key, stale._replace(fresh_until=time.time() - 1), ttl=60)
+        served = await asyncio.gather(*[compute(1) for _ in range(3)])
+        await asyncio.sleep(0.05)
+        return first, served, await compute(1), key
+
+    first, served, refreshed, key = asyncio.run(run())
+    assert (first, served, refreshed) == (1, [1, 1, 1], 2)
+    assert len(calls) == 2
+    namespace = compute.cached.namespace
+    assert CacheStatistics.collect()[namespace]['stale_hits'] == 3
+    assert CacheStatistics.collect()[namespace]['stale_keys'] == {key: 3}
+
+
+def test_stale_keys_bounded():
+    """Only the most recently served stale keys are counted per key."""
+    @cached(ttl=60)
+    async def compute(value):
+        return value
+
+    namespace = compute.cached.namespace
+    for i in range(CacheStatistics.max_stale_keys + 5):
+        CacheStatistics.stale(namespace, 'key{}'.format(i))
+    stale_keys = CacheStatistics.collect()[namespace]['stale_keys']
+    assert len(stale_keys) == CacheStatistics.max_stale_keys
+    assert 'key0' not in stale_keys
+    assert CacheStatistics.collect()[namespace]['stale_hits'] == CacheStatistics.max_stale_keys + 5
+
+
+def test_persist_versioned_by_source():
+    """Persisted values of functions with different statements are kept apart."""
+    async def first(database):
+        return await database.fetch_one('select 1')
+
+    async def second(database):
+        return await database.fetch_one('select 2')
+
+    versions = [cached(ttl=None, persist=persist) for persist in (True, True, 'v1')]
+    for decorator, func in zip(versions, [first, second, first]):
+        decorator(func)
+    assert versions[0].persist == source_version(first)
+    assert len({decorator.persist for decorator in versions}) == 3
+    assert versions[2].persist == 'v1'
+
+
+def test_targeted_invalidation():
+    """Only entries an event affects are dropped."""
+    calls = []
+
+    def same_dataset(payload, arguments):
+        return arguments['dataset_id'] == payload['dataset_id']
+
+    @cached(ttl=None, invalidate_on={'added': same_dataset})
+    async def versions(database, dataset_id):
+        calls.append(dataset_id)
+        return dataset_id
+
+    @cached(ttl=None, invalidate_on=['added'])
+    async def total(database):
+        calls.append('total')
+        return len(calls)
+
+    async def run():
+        for dataset_id in (0, 1, 100):
+            await versions(None, dataset_id)
+        await total(None)
+        await CacheBus.publish('added', dataset_id=1)
+        for dataset_id in (0, 1, 100):
+            await versions(None, dataset_id)
+        await total(None)
+
+    asyncio.run(run())
+    assert calls == [0, 1, 100, 'total', 1, 'total']
+
+
+def test_restored_entries_invalidated():
+    """Entries with unknown arguments are dropped by any event."""
+    calls = []
+
+    @cached(ttl=None, invalidate_on={'restored': lambda payload, arguments: False})
+    async def compute(database, value):
+        calls.append(value)
+        return value
+
+    async def run():
+        await compute(None, 1)
+        compute.cached.restore(compute.cached.cache.dump())
+        await CacheBus.publish('restored')
+        await compute(None, 1)
+
+    asyncio.run(run())
+    assert calls == [1, 1]
+
+
+def test_exclusive_local_job(tmp_path):
+    """Exclusive local jobs are skipped by workers if another ran them recently."""
+    calls = []
+
+    async def refresh(database):
+        calls.append(database)
+
+    workers = [Warmer()(database) for database in ('first', 'second')]
+    for worker in workers:
+        worker.register(refresh, 60, None, local=True, exclusive=True)
+        worker._status['refresh'] = dict(shared=0) # pylint: disable=protected-access
+
+    async def run():
+        CacheStore(str(tmp_path / 'store.sqlite'))
+        await CacheStore.setup()
+        try:
+            for worker in workers:
+                await worker.run('refresh', refresh, [], 60)
+        finally:
+            await CacheStore.teardown()
+
+    asyncio.run(run())
+    assert calls == ['first']
+    assert workers[1].status()['refresh']['shared'] == 1
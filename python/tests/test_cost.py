@@ -0,0 +1,82 @@
+"""Query cost."""
+import os
+import re
+
+from graphql import parse, validate
+
+from aocrecs.cost import cost_rule, DEFAULT_BUDGET
+from aocrecs.resolvers import SCHEMA
+
+
+QUERY_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'js', 'src', 'graphql')
+TEMPLATE = re.compile(r'gql`(.*?)`', re.DOTALL)
+INTERPOLATION = re.compile(r'\$\{(\w+)\}')
+
+
+class Context:
+    """Holds the computed cost."""
+
+    def __init__(self):
+        """Initialize."""
+        self.cost = None
+
+
+def load_query(name):
+    """Read the query of a frontend module, with fragments interpolated."""
+    with open(os.path.join(QUERY_PATH, '{}.js'.format(name))) as module:
+        template = TEMPLATE.search(module.read()).group(1)
+    return INTERPOLATION.sub(lambda match: load_query(match.group(1)), template)
+
+
+def cost(query, variables=None, budget=DEFAULT_BUDGET):
+    """Validate a query under a budget, returning its cost and errors."""
+    context = Context()
+    errors = validate(SCHEMA, parse(query), [cost_rule(context, variables or {}, budget)])
+    return context.cost['requested'], errors
+
+
+def test_frontend_queries_within_budget():
+    """Every query of the site validates under the default budget."""
+    names = sorted(f[:-3] for f in os.listdir(QUERY_PATH) if f.endswith('.js'))
+    assert names
+    for name in names:
+        query = load_query(name)
+        if 'fragment' in query and 'query' not in query and 'mutation' not in query:
+            continue
+        requested, errors = cost(query, dict(limit=100, offset=0))
+        assert not errors, (name, requested, errors)
+
+
+def test_limit_sizes_lists_below():
+    """A search limit multiplies its hits, capped, but not its count or facets."""
+    template = """{{
+        search {{ matches(params: {{}}, limit: {}) {{
+            count
+            facets(fields: ["matches.map_name", "players.civilization_id"]) {{ field }}
+            hits {{ id players {{ flags {{ type }} }} }}
+        }} }}
+    }}"""
+    one, _ = cost(template.format(1))
+    ten, _ = cost(template.format(10))
+    thousand, _ = cost(template.format(1000))
+    per_hit = ten - one
+    assert per_hit > 0
+    assert thousand == ten
+    assert one > 5 + 2 * 10
+
+
+def test_report_limit():
+    """A report limit sizes the report's lists, not its scalars."""
+    small, _ = cost('{ report(year: 2020, month: 1, limit: 1) { total_matches most_matches { user { id } } } }')
+    large, _ = cost('{ report(year: 2020, month: 1, limit: 50) { total_matches most_matches { user { id } } } }')
+    scalar, _ = cost('{ report(year: 2020, month: 1, limit: 50) { total_matches } }')
+    assert large - small == 49
+    assert scalar == 1
+
+
+def test_over_budget():
+    """Queries over budget are rejected."""
+    query = '{ search { matches(params: {}, limit: 10) { hits { graph { nodes { id } } } } } }'
+    requested, errors = cost(query, budget=10)
+    assert requested > 10
+    assert errors and 'exceeds budget' in errors[0].message
@@ -0,0 +1,36 @@
+"""Instrumented database access."""
+import asyncio
+
+from aocrecs.database import Pool
+from aocrecs.util import prometheus_text
+
+
+class SlowDatabase:
+    """Answers every statement after a delay."""
+
+    async def fetch_one(self, query, values=None):
+        """Fetch a row."""
+        await asyncio.sleep(0.05)
+        return query
+
+
+def test_statement_time_excludes_wait():
+    """Statements are timed once they have a connection."""
+    pool = Pool(SlowDatabase(), 1)
+    seconds = []
+
+    async def run():
+        await asyncio.gather(*[
+            pool.run('fetch_one', 'select 1', None, lambda elapsed, _: seconds.append(elapsed)) for _ in range(3)
+        ])
+
+    asyncio.run(run())
+    assert len(seconds) == 3
+    assert max(seconds) < 0.09
+    assert pool.status()['wait_seconds'] >= 0.14
+
+
+def test_prometheus_label_escaped():
+    """Label values are escaped."""
+    text = prometheus_text('metric', 'key', {'a "b"\\c\nd': dict(count=1)})
+    assert 'metric_count{key="a \\"b\\"\\\\c\\nd"} 1' in text.splitlines()
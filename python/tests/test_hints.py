@@ -0,0 +1,37 @@
+"""Cache hints."""
+import asyncio
+
+from graphql import parse, get_operation_ast
+
+from aocrecs.api import GraphQL, MUTABLE
+from aocrecs.cache import CacheBus
+from aocrecs.consts import MATCH_ADDED
+from aocrecs.hints import max_age, IMMUTABLE
+from aocrecs.resolvers import SCHEMA
+
+
+def age(query):
+    """Maximum age of a query."""
+    document = parse(query)
+    return max_age(SCHEMA, document, get_operation_ast(document))
+
+
+def test_mutable_below_match():
+    """Fields that change as matches are added shorten the hint of a match."""
+    assert age('{ match(id: 1) { id players { name user { id name } } } }') == IMMUTABLE
+    assert age('{ match(id: 1) { id odds { teams { wins } } } }') < IMMUTABLE
+    assert age('{ match(id: 1) { players { user { meta_ranks { rating } } } } }') < IMMUTABLE
+    assert age('{ match(id: 1) { players { user { matches { count } } } } }') < IMMUTABLE
+
+
+def test_match_added_keeps_immutable():
+    """Adding a match drops only responses that can change."""
+    app = GraphQL(SCHEMA)
+
+    async def run():
+        await app.responses.set('immutable', 1)
+        await app.responses.set(MUTABLE + 'mutable', 2)
+        await CacheBus.publish(MATCH_ADDED, match_id=1)
+        return await app.responses.get('immutable'), await app.responses.get(MUTABLE + 'mutable')
+
+    assert asyncio.run(run()) == (1, None)
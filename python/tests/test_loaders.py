@@ -0,0 +1,34 @@
+"""Cached loaders."""
+import asyncio
+
+from aocrecs.database import WORKLOAD, ANALYTICS
+from aocrecs.logic import playback
+
+
+class Database:
+    """Record the workload class of each statement."""
+
+    def __init__(self):
+        """Initialize."""
+        self.workloads = []
+
+    async def fetch_all(self, query, values=None):
+        """Return one APM row."""
+        self.workloads.append(WORKLOAD.get())
+        return [dict(match_id=1, player_number=1, timestamp=0, timestamp_secs=0, actions=3)]
+
+
+class Context:
+    """Loader context."""
+
+    def __init__(self, database):
+        """Initialize."""
+        self.database = database
+
+
+def test_workload_loader():
+    """A loader declaring a workload class is cached by key and uses its pool."""
+    database = Database()
+    result = asyncio.run(playback.get_apm([(1, 1)], Context(database)))
+    assert list(result.keys()) == [(1, 1)]
+    assert database.workloads == [ANALYTICS]
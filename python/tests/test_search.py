@@ -0,0 +1,128 @@
+"""Search."""
+import asyncio
+import random
+import sqlite3
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from aocrecs.logic import search
+from aocrecs.logic.search_index import MatchIndex, MATCH_FIELDS
+from aocrecs.logic.match_flags import MatchFlags
+
+
+MATCH_ADDED = dict(
+    match_id=10, dataset_id=100, platform_id='de', map_name='Arabia',
+    players=[dict(number=1, user_id=5, civilization_id=3), dict(number=2, user_id=6, civilization_id=4)]
+)
+# Civilizations of each match's players, by match ID.
+CIVILIZATIONS = {1: [1, 2], 2: [1, 1], 3: [2, 3], 4: [3, 4], 5: [1, 4]}
+
+
+class Database:
+    """Serves the matches of `CIVILIZATIONS`, and their counts grouped like Postgres would."""
+
+    async def fetch_all(self, query, values=None):
+        """Fetch index rows, or grouping set counts of a search on civilizations."""
+        if 'grouping sets' not in query:
+            if 'from players' in query:
+                return [dict(match_id=i, civilization_id=c) for i, civs in CIVILIZATIONS.items() for c in set(civs)]
+            return [dict(dict.fromkeys(MATCH_FIELDS), id=i, played=datetime(2020, 1, 1 + i % 2)) for i in CIVILIZATIONS]
+        matching = {i: civs for i, civs in CIVILIZATIONS.items() if set(civs) & set(values['players_civilization_id'])}
+        grouped = Counter()
+        for civs in matching.values():
+            if 'unfiltered_players.civilization_id as facet_0' in query:
+                grouped.update(set(civs))
+            else:
+                grouped.update(set(civs) & set(values['players_civilization_id']))
+        rows = [dict(count=len(matching), facet_0=None, grouped_0=1)]
+        return rows + [dict(count=count, facet_0=civ, grouped_0=0) for civ, count in grouped.items()]
+
+
+def test_search_affected():
+    """Cached searches restricted to other values than those of a new match are kept."""
+    def affected(params):
+        return search.search_affected(MATCH_ADDED, dict(params=params))
+
+    assert affected({})
+    assert affected({'matches': {'map_name': {'values': ['Arabia', 'Arena']}}})
+    assert affected({'matches': {'played': {'gte': '2020-01-01'}}})
+    assert affected({'players': {'civilization_id': {'values': [4]}}})
+    assert not affected({'matches': {'map_name': {'values': ['Arena']}}})
+    assert not affected({'matches': {'dataset_id': {'values': [0, 1]}}})
+    assert not affected({'players': {'civilization_id': {'values': [9]}}})
+
+
+def test_unmaterialized_flags_computed():
+    """With materialized flags, searches compute flags of any match not materialized."""
+    MatchFlags.configure(enabled=True)
+    try:
+        query, _, args = search.build_query({'flags': {'deer_pushes': {}}}, None, 0, 10)
+    finally:
+        MatchFlags.configure(enabled=False)
+    assert 'from match_flags where flag_type=' in query
+    assert 'v.match_id=computed.match_id' in query
+    assert 'max(match_id)' not in query
+    assert args
+
+
+def test_facets_agree(monkeypatch):
+    """Facets from the index and from the database count matching matches per value alike."""
+    index = MatchIndex()
+    asyncio.run(index.refresh(Database()))
+    monkeypatch.setattr(search, 'SearchIndex', index)
+    params = {'players': {'civilization_id': {'values': [1]}}}
+    fields = ['players.civilization_id']
+    indexed = asyncio.run(search._get_counts(Database(), params, fields)) # pylint: disable=protected-access
+    counted = asyncio.run(search._cached_get_counts(Database(), params, fields, cache_read=False)) # pylint: disable=protected-access
+    assert indexed == counted
+    assert counted == dict(count=3, facets={'players.civilization_id': [
+        dict(value=1, count=3), dict(value=2, count=1), dict(value=4, count=1)
+    ]})
+
+
+def test_cursor_round_trip():
+    """Cursors decode to the values they encode, and reject anything else."""
+    values = [datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc), date(2020, 1, 2), timedelta(minutes=5), None, 'x', 7]
+    assert search.decode_cursor(search.encode_cursor(values)) == values
+    for cursor in ('not a cursor', 'e30=', '!'):
+        with pytest.raises(ValueError):
+            search.decode_cursor(cursor)
+
+
+def test_keyset_pages():
+    """Paging by cursor visits every row once, in order, with nulls on either side."""
+    rng = random.Random(1)
+    connection = sqlite3.connect(':memory:')
+    connection.execute('create table matches (id integer, rated integer, played integer)')
+    connection.executemany('insert into matches values (?, ?, ?)', [
+        (i, rng.choice([None, 0, 1]), rng.choice([None, 1, 2, 3])) for i in range(1, 61)
+    ])
+    fields = ['matches.rated', 'matches.played', 'matches.id']
+    query = 'select rated, played, id from matches {} order by rated desc nulls first, played desc nulls last, id desc'
+    expected = connection.execute(query.format('')).fetchall()
+    pages, cursor = [], None
+    while True:
+        args = {}
+        where = 'where ' + search.keyset_filter(fields, search.decode_cursor(cursor), args) if cursor else ''
+        rows = connection.execute(query.format(where) + ' limit 7', args).fetchall()
+        pages.extend(rows)
+        if len(rows) < 7:
+            break
+        cursor = search.encode_cursor(list(rows[-1]))
+    assert pages == expected
+
+
+def test_index_cursor(monkeypatch):
+    """Cursors of indexed hits continue where the previous page ended."""
+    index = MatchIndex()
+    asyncio.run(index.refresh(Database()))
+    monkeypatch.setattr(search, 'SearchIndex', index)
+    everything, _ = search._indexed_hits({}, 0, 10) # pylint: disable=protected-access
+    first, cursor = search._indexed_hits({}, 0, 2) # pylint: disable=protected-access
+    second, _ = search._indexed_hits({}, 0, 2, cursor) # pylint: disable=protected-access
+    assert [hit['id'] for hit in everything] == [5, 3, 1, 4, 2]
+    assert first + second == everything[:4]
+    with pytest.raises(ValueError):
+        search._indexed_hits({}, 0, 2, search.encode_cursor(['x', 1])) # pylint: disable=protected-access
@@ -0,0 +1,97 @@
+"""In-memory search index."""
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from aocrecs.cache import CacheStore
+from aocrecs.logic.search_index import MatchIndex, MATCH_FIELDS
+
+
+MAP_NAMES = ['Arabia', 'Arena']
+
+
+class Database:
+    """Serves matches and players from memory."""
+
+    def __init__(self, matches):
+        """Initialize."""
+        self.matches = matches
+        self.queries = 0
+
+    async def fetch_all(self, query, values=None):
+        """Fetch matches or players with an ID above `after`."""
+        self.queries += 1
+        rows = [match for match in self.matches if match['id'] > values['after']]
+        if 'from players' in query:
+            return [dict(match_id=match['id'], civilization_id=match['civilization_id']) for match in rows]
+        return sorted(rows, key=index_order)
+
+
+def match(match_id, played, map_name='Arabia', civilization_id=1):
+    """Make a match row."""
+    return dict(
+        dict.fromkeys(MATCH_FIELDS), id=match_id, played=played, map_name=map_name, civilization_id=civilization_id
+    )
+
+
+def index_order(row):
+    """Sort key of `played nulls first, id`."""
+    return row['played'] is not None, row['played'] or datetime.min, row['id']
+
+
+def search_order(matches):
+    """`(played, id)` of matches in search order, the reverse of index order."""
+    return [(m['played'], m['id']) for m in sorted(matches, key=index_order, reverse=True)]
+
+
+def test_out_of_order_pages():
+    """Matches added after others played later are merged into pages in search order."""
+    rng = random.Random(1)
+    start = datetime(2020, 1, 1)
+    matches = [
+        match(i, None if i % 17 == 0 else start + timedelta(hours=rng.randint(0, 1000)), rng.choice(MAP_NAMES))
+        for i in range(1, 301)
+    ]
+    index = MatchIndex()
+    for i in range(0, 300, 50):
+        database = Database(matches[:i + 50])
+        asyncio.run(index.refresh(database))
+    assert index.status()['late'] > 0
+    for map_names in (None, ['Arena']):
+        params = {'matches': {'map_name': {'values': map_names}}} if map_names else {}
+        expected = search_order([m for m in matches if not map_names or m['map_name'] in map_names])
+        bitmap = index.matching(params)
+        assert index.page(bitmap, 0, 1000) == expected
+        assert index.page(bitmap, 10, 20) == expected[10:30]
+        pages, after = [], None
+        while True:
+            rows = index.page(bitmap, 0, 7, after)
+            pages.extend(rows)
+            if len(rows) < 7:
+                break
+            after = rows[-1]
+        assert pages == expected
+
+
+def test_shared_refresh(tmp_path):
+    """Workers index matches fetched by another worker's refresh."""
+    matches = [match(i, datetime(2020, 1, i)) for i in range(1, 21)]
+    first, second = Database(matches[:10]), Database(matches[:10])
+    workers = [MatchIndex(), MatchIndex()]
+
+    async def run():
+        CacheStore(str(tmp_path / 'store.sqlite'))
+        await CacheStore.setup()
+        try:
+            await workers[0].refresh(first)
+            await workers[1].refresh(second)
+            first.matches = second.matches = matches
+            await workers[0].refresh(first)
+            await workers[1].refresh(second)
+        finally:
+            await CacheStore.teardown()
+
+    asyncio.run(run())
+    assert (first.queries, second.queries) == (4, 2)
+    for worker in workers:
+        assert worker.page(worker.matching({}), 0, 100) == search_order(matches)